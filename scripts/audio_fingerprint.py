@@ -0,0 +1,331 @@
+"""
+Audio fingerprints and a reviewed-recording index for the TECW verification engine
+Spectral-peak constellation hashes from a streaming STFT, looked up in an inverted hash -> (clip, offset) index
+
+WAV input is read a second at a time, so memory stays bounded however long
+the recording is. Needs NumPy.
+
+    python audio_fingerprint.py add --verdict FALSE --description "Fake curfew voice note" note.wav
+    python audio_fingerprint.py match forwarded.wav
+"""
+
+import io
+import json
+import os
+import time
+import uuid
+import wave
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # audio matching is optional; text verification works without NumPy
+    np = None
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "audio_fingerprints")
+# Frames are fixed in time rather than in samples, so bin k is always k / FRAME_SECONDS Hz
+# and recordings at different sample rates hash alike without resampling
+FRAME_SECONDS = 0.064
+HOP_FRACTION = 0.5
+MAX_FREQUENCY = 4000  # voice band; also all an 8 kHz recording has
+# Frequency bands (in bins of 1 / FRAME_SECONDS = 15.6 Hz) that each contribute at most one peak per frame
+BAND_EDGES = (6, 13, 26, 51, 102, 179, 257)
+PEAK_DB_ABOVE_MEDIAN = 10.0
+SILENCE_DB = -60.0
+# Each peak is paired with up to FAN_OUT earlier peaks at most TARGET_FRAMES frames back
+FAN_OUT = 5
+TARGET_FRAMES = 63
+MAX_SECONDS = 600
+CHUNK_SECONDS = 1.0
+# A match needs this many hashes agreeing on the same time offset, and that
+# share of the query's hashes (unrelated speech still lines up a percent or two)
+MIN_ALIGNED = 20
+MIN_SCORE = 0.05
+# Hashes this common across the index carry no information and are skipped at lookup
+MAX_POSTINGS = 2000
+
+
+def audio_fingerprinting_available() -> bool:
+    return np is not None
+
+
+def _pcm_to_mono(raw: bytes, sample_width: int, channels: int):
+    if sample_width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0
+        scale = 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+        scale = 32768.0
+    elif sample_width == 3:
+        bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        samples = (bytes3[:, 0].astype(np.int32) | (bytes3[:, 1].astype(np.int32) << 8) | (bytes3[:, 2].astype(np.int32) << 16))
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples).astype(np.float32)
+        scale = float(1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32)
+        scale = float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    return samples / scale
+
+
+def iter_wav_chunks(source: Any, max_seconds: Optional[float] = MAX_SECONDS) -> Iterator[Tuple[Any, int]]:
+    """Yield (mono float32 samples, sample rate) about CHUNK_SECONDS at a time from a WAV path, bytes or file object"""
+    if not audio_fingerprinting_available():
+        raise RuntimeError("NumPy is required for audio fingerprinting (pip install numpy)")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        reader = wave.open(source, "rb")
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Not a PCM WAV file: {e}")
+    with reader:
+        rate = reader.getframerate()
+        chunk = max(1, int(rate * CHUNK_SECONDS))
+        remaining = int(rate * max_seconds) if max_seconds else None
+        while remaining is None or remaining > 0:
+            raw = reader.readframes(chunk if remaining is None else min(chunk, remaining))
+            if not raw:
+                break
+            samples = _pcm_to_mono(raw, reader.getsampwidth(), reader.getnchannels())
+            if remaining is not None:
+                remaining -= len(samples)
+            yield samples, rate
+
+
+def _frame_peaks(spectra_db):
+    """(frame index within the batch, bin) of the strongest bin in each band, if it stands out"""
+    peaks = []
+    medians = np.median(spectra_db[:, BAND_EDGES[0]:BAND_EDGES[-1]], axis=1)
+    for low, high in zip(BAND_EDGES, BAND_EDGES[1:]):
+        band = spectra_db[:, low:high]
+        best = band.argmax(axis=1)
+        level = band[np.arange(len(band)), best]
+        keep = (level > medians + PEAK_DB_ABOVE_MEDIAN) & (level > SILENCE_DB)
+        peaks.extend(zip(np.nonzero(keep)[0].tolist(), (best[keep] + low).tolist()))
+    peaks.sort()
+    return peaks
+
+
+def iter_fingerprint(chunks: Iterator[Tuple[Any, int]]) -> Iterator[Any]:
+    """Yield arrays of (hash, anchor frame) uint32 pairs as the audio streams in.
+
+    Only a frame's worth of samples and the last TARGET_FRAMES frames of
+    peaks are kept between chunks. A hash packs the anchor bin (9 bits), the
+    paired peak's bin (9 bits) and the frame gap between them (6 bits).
+    """
+    buffer = None
+    window = None
+    frame_length = hop = None
+    frame_index = 0
+    recent = deque()  # (frame, bin) of peaks that can still be anchors
+    for samples, rate in chunks:
+        if frame_length is None:
+            frame_length = int(round(rate * FRAME_SECONDS))
+            hop = max(1, int(frame_length * HOP_FRACTION))
+            window = np.hanning(frame_length).astype(np.float32)
+            buffer = np.zeros(0, dtype=np.float32)
+        buffer = np.concatenate([buffer, samples])
+        frames = (len(buffer) - frame_length) // hop + 1 if len(buffer) >= frame_length else 0
+        if frames <= 0:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, frame_length)[::hop][:frames]
+        spectra = np.abs(np.fft.rfft(windows * window, axis=1))[:, :BAND_EDGES[-1]]
+        spectra_db = 20 * np.log10(spectra / (frame_length / 4) + 1e-10)
+
+        pairs = []
+        for offset, peak_bin in _frame_peaks(spectra_db):
+            frame = frame_index + offset
+            while recent and recent[0][0] < frame - TARGET_FRAMES:
+                recent.popleft()
+            paired = 0
+            for anchor_frame, anchor_bin in reversed(recent):
+                if anchor_frame == frame:
+                    continue
+                pairs.append(((anchor_bin << 15) | (peak_bin << 6) | (frame - anchor_frame), anchor_frame))
+                paired += 1
+                if paired == FAN_OUT:
+                    break
+            recent.append((frame, peak_bin))
+        buffer = buffer[frames * hop:]
+        frame_index += frames
+        if pairs:
+            yield np.array(pairs, dtype=np.uint32)
+
+
+def fingerprint(source: Any, max_seconds: Optional[float] = MAX_SECONDS) -> Tuple[Any, float]:
+    """All (hash, anchor frame) pairs of a WAV recording, and its duration in seconds"""
+    duration = [0.0]
+
+    def counted():
+        for samples, rate in iter_wav_chunks(source, max_seconds):
+            duration[0] += len(samples) / rate
+            yield samples, rate
+
+    parts = list(iter_fingerprint(counted()))
+    hashes = np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.uint32)
+    return hashes, duration[0]
+
+
+def frame_seconds(frames: int) -> float:
+    return round(frames * FRAME_SECONDS * HOP_FRACTION, 2)
+
+
+class AudioFingerprintIndex:
+    """Previously reviewed recordings, matched by constellation hashes.
+
+    The inverted index is kept as one array of hashes sorted for binary
+    search with parallel arrays of clip number and anchor frame. A query
+    looks up all its hashes at once and votes for (clip, time offset);
+    a re-forward of a known clip lines up many hashes on one offset even if
+    it was trimmed, re-encoded or recorded at another volume.
+
+    With `path` set, each clip's hashes are saved there as .npy next to a
+    clips.jsonl of metadata, and reloaded on start; adding a clip does not
+    rewrite the others.
+    """
+
+    def __init__(self, path: Optional[str] = None, min_aligned: int = MIN_ALIGNED, min_score: float = MIN_SCORE):
+        self.path = path
+        self.min_aligned = min_aligned
+        self.min_score = min_score
+        self._clips: List[Dict] = []
+        self._pending: List[Tuple[int, Any]] = []  # (clip number, hashes) not merged yet
+        self._hashes = self._clip_numbers = self._frames = None
+        self.stats = {"lookups": 0, "hits": 0}
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._clips)
+
+    def add(self, hashes, verdict: str, description: str = "", source: Optional[str] = None,
+            duration: Optional[float] = None) -> Dict:
+        """Index a reviewed clip's fingerprint; returns its metadata record"""
+        clip = {
+            # Unique across processes: the CLI and running services add to the same directory
+            "id": f"clip-{uuid.uuid4().hex}",
+            "verdict": verdict,
+            "description": description,
+            "source": source,
+            "duration_s": round(duration, 2) if duration is not None else None,
+            "hashes": int(len(hashes)),
+            "added_at": time.time()
+        }
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            # "x" mode: never overwrite another clip's fingerprint
+            with open(os.path.join(self.path, f"{clip['id']}.npy"), "xb") as f:
+                np.save(f, np.asarray(hashes, dtype=np.uint32))
+            with open(os.path.join(self.path, "clips.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(clip) + "\n")
+        self._clips.append(clip)
+        self._pending.append((len(self._clips) - 1, np.asarray(hashes, dtype=np.uint32)))
+        return clip
+
+    def add_recording(self, source: Any, verdict: str, description: str = "", name: Optional[str] = None) -> Dict:
+        hashes, duration = fingerprint(source)
+        return self.add(hashes, verdict, description, source=name, duration=duration)
+
+    def _merge(self):
+        if not self._pending:
+            return
+        parts = [] if self._hashes is None else [(self._hashes, self._clip_numbers, self._frames)]
+        for number, hashes in self._pending:
+            parts.append((hashes[:, 0], np.full(len(hashes), number, dtype=np.uint32), hashes[:, 1]))
+        self._pending = []
+        hashes = np.concatenate([p[0] for p in parts])
+        order = np.argsort(hashes, kind="stable")
+        self._hashes = hashes[order]
+        self._clip_numbers = np.concatenate([p[1] for p in parts])[order]
+        self._frames = np.concatenate([p[2] for p in parts])[order]
+
+    def match(self, hashes) -> List[Dict]:
+        """Reviewed clips that line up with the query fingerprint, best first"""
+        self._merge()
+        self.stats["lookups"] += 1
+        if self._hashes is None or not len(hashes):
+            return []
+        query = np.asarray(hashes, dtype=np.uint32)
+        left = np.searchsorted(self._hashes, query[:, 0], side="left")
+        right = np.searchsorted(self._hashes, query[:, 0], side="right")
+        counts = right - left
+        usable = (counts > 0) & (counts <= MAX_POSTINGS)
+        left, counts, query_frames = left[usable], counts[usable], query[usable, 1].astype(np.int64)
+        if not len(counts):
+            return []
+
+        # Expand each query hash into its postings without a Python loop
+        total = int(counts.sum())
+        starts = np.repeat(left - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        postings = starts + np.arange(total)
+        clip_numbers = self._clip_numbers[postings].astype(np.int64)
+        offsets = self._frames[postings].astype(np.int64) - np.repeat(query_frames, counts)
+
+        keys, votes = np.unique(clip_numbers * (1 << 33) + (offsets + (1 << 32)), return_counts=True)
+        threshold = max(self.min_aligned, self.min_score * len(query))
+        best = {}
+        for key, count in zip(keys.tolist(), votes.tolist()):
+            number, offset = key >> 33, (key & ((1 << 33) - 1)) - (1 << 32)
+            if count >= threshold and count > best.get(number, (0, 0))[0]:
+                best[number] = (count, offset)
+        matches = []
+        for number, (count, offset) in best.items():
+            clip = self._clips[number]
+            matches.append({
+                "id": clip["id"],
+                "verdict": clip["verdict"],
+                "description": clip["description"],
+                "source": clip["source"],
+                "aligned_hashes": count,
+                "score": round(count / len(query), 3),
+                "offset_s": frame_seconds(offset)
+            })
+        matches.sort(key=lambda m: m["aligned_hashes"], reverse=True)
+        if matches:
+            self.stats["hits"] += 1
+        return matches
+
+    def snapshot(self) -> Dict:
+        postings = sum(clip["hashes"] for clip in self._clips)
+        return dict(self.stats, clips=len(self._clips), postings=postings)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, "clips.jsonl"), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                clip = json.loads(line)
+                hashes = np.load(os.path.join(self.path, f"{clip['id']}.npy"))
+            except (ValueError, KeyError, OSError):
+                continue  # a torn last line or a missing array
+            self._clips.append(clip)
+            self._pending.append((len(self._clips) - 1, hashes))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Manage the index of reviewed voice notes")
+    parser.add_argument("--index", default=DEFAULT_INDEX_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Add reviewed WAV recordings")
+    add.add_argument("--verdict", required=True, help="TRUE, FALSE or MISLEADING")
+    add.add_argument("--description", default="")
+    add.add_argument("recordings", nargs="+")
+    match = sub.add_parser("match", help="Look up WAV recordings in the index")
+    match.add_argument("recordings", nargs="+")
+    args = parser.parse_args()
+
+    index = AudioFingerprintIndex(args.index)
+    for path in args.recordings:
+        if args.command == "add":
+            print(json.dumps(index.add_recording(path, args.verdict.upper(), args.description or os.path.basename(path), name=path)))
+        else:
+            hashes, duration = fingerprint(path)
+            print(json.dumps({"recording": path, "duration_s": round(duration, 2), "matches": index.match(hashes)}))
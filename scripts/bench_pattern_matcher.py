@@ -0,0 +1,81 @@
+"""
+Benchmark: Aho-Corasick PatternMatcher vs. the naive `pattern in text` loop
+
+Usage:
+    python bench_pattern_matcher.py [--patterns 10000] [--messages 2000]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from pattern_matcher import PatternMatcher
+
+WORDS = (
+    "government giving money register receive click link claim account suspended verify "
+    "orange africell afrimoney pin transfer wrong bonus promo winner lottery prize ministry "
+    "president health ebola salone freetown bo kenema makeni loan grant fund scholarship "
+    "visa passport job offer urgent today free airtime data bundle whatsapp facebook"
+).split()
+
+
+def synthetic_patterns(count, rng):
+    patterns = set()
+    while len(patterns) < count:
+        patterns.add(" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))))
+    return sorted(patterns)
+
+
+def synthetic_messages(count, rng):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 40))) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patterns", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    patterns = synthetic_patterns(args.patterns, rng)
+    messages = synthetic_messages(args.messages, rng)
+
+    start = time.perf_counter()
+    matcher = PatternMatcher((p, "scam") for p in patterns)
+    matcher.build()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    automaton_hits = sum(len(matcher.find_all(m)) for m in messages)
+    automaton_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive_hits = 0
+    for message in messages:
+        lowered = message.lower()
+        naive_hits += sum(1 for p in patterns if p in lowered)
+    naive_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "patterns": len(patterns),
+        "messages": len(messages),
+        "build_ms": round(build_ms, 1),
+        "automaton": {
+            "total_s": round(automaton_s, 3),
+            "per_message_us": round(automaton_s / len(messages) * 1e6, 1),
+            "matches": automaton_hits
+        },
+        # Substring matches, so this also counts hits inside longer words
+        "naive_substring": {
+            "total_s": round(naive_s, 3),
+            "per_message_us": round(naive_s / len(messages) * 1e6, 1),
+            "matches": naive_hits
+        },
+        "speedup": round(naive_s / automaton_s, 1) if automaton_s else None
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Bulk verification of monitoring feeds for the TECW verification engine
+Streams JSONL posts through VerificationService on a process pool and writes verdicts in input order
+
+Every stage is a generator and at most --max-pending batches are in flight,
+so memory stays flat however large the feed is.
+
+    python bulk_verify.py posts.jsonl -o verdicts.jsonl --workers 8
+    zcat posts.jsonl.gz | python bulk_verify.py - > verdicts.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from evidence_ledger import EvidenceLedger
+from verification_service import VerificationService
+
+DEFAULT_BATCH_SIZE = 256
+# Batches submitted per worker ahead of the writer; enough to keep every worker busy
+PENDING_PER_WORKER = 4
+# Scrapers name the post body differently; the first non-empty one is used
+TEXT_FIELDS = ("text", "message", "content", "body", "caption")
+MEDIA_FIELDS = {
+    "image": ("pixels", "image_data"),
+    "audio": ("audio_data",)
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+# One service per worker process, built by _init_worker
+_service: Optional[VerificationService] = None
+
+
+def read_jsonl(stream: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    """(line number, decoded record) for each non-blank line; undecodable lines yield (line, None)"""
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def _clean(text: str) -> str:
+    # NFC so visually identical posts hash alike; collapsed whitespace for the same reason
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def normalize(record: Any) -> Optional[Dict]:
+    """The verify_claim content for a scraped post, or None if there is nothing to verify.
+
+    Media posts keep their text as "caption" too, which is what the image
+    check scans for scam wording.
+    """
+    if not isinstance(record, dict):
+        return None
+    claim_type = record.get("type")
+    text = next((record[f] for f in TEXT_FIELDS if isinstance(record.get(f), str) and record[f].strip()), None)
+    if text is not None:
+        text = _clean(text)
+
+    if claim_type is None:
+        for media_type, fields in MEDIA_FIELDS.items():
+            if any(record.get(f) is not None for f in fields):
+                claim_type = media_type
+                break
+        else:
+            claim_type = "text"
+
+    if claim_type == "text":
+        return {"type": "text", "text": text} if text else None
+    # Never file paths: a post must not be able to make us read local files (see media_path)
+    content = {k: v for k, v in record.items() if k in MEDIA_FIELDS.get(claim_type, ())}
+    content["type"] = claim_type
+    if text:
+        content["text"] = text
+        caption = record.get("caption")
+        content["caption"] = _clean(caption) if isinstance(caption, str) and caption.strip() else text
+    return content
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _init_worker(media_dir: Optional[str] = None) -> None:
+    global _service
+    _service = VerificationService(media_dir=media_dir)
+
+
+def verify_batch(batch: List[Tuple[int, Any]]) -> List[Dict]:
+    """Verify one batch of (line number, record) in a worker; one output row per input row"""
+    service = _service
+    if service is None:
+        _init_worker()
+        service = _service
+    rows = []
+    for line_no, record in batch:
+        row = {"line": line_no}
+        if isinstance(record, dict) and "id" in record:
+            row["id"] = record["id"]
+        content = normalize(record)
+        if content is None:
+            row["error"] = "invalid JSON" if record is None else "nothing to verify"
+            rows.append(row)
+            continue
+        # Media the scraper saved to disk, resolved inside --media-dir only
+        media_path = record.get("media_path") if content["type"] != "text" else None
+        media_path = media_path if isinstance(media_path, str) else None
+        try:
+            row["evidence_hash"] = service.calculate_evidence_hash(content, media_path)
+            result = service.verify_claim(content, media_path)
+        except Exception as e:  # one bad post must not stop an overnight run
+            row["error"] = f"{type(e).__name__}: {e}"
+        else:
+            result.pop("pattern_matches", None)  # character offsets into the post; large and rarely wanted
+            row.update(result)
+        rows.append(row)
+    return rows
+
+
+def run_pipeline(records: Iterable[Tuple[int, Any]], out, workers: int = 1, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_pending: Optional[int] = None, ledger: Optional[EvidenceLedger] = None,
+                 media_dir: Optional[str] = None) -> Dict:
+    """Verify (line number, record) pairs and write one JSON line per record to out, in input order.
+
+    Batches go to the pool with apply_async and the oldest is always written
+    first; once max_pending batches are outstanding the reader waits for the
+    writer, so a slow consumer or slow workers hold back the input instead of
+    letting results pile up. Pool.imap is not used because it drains its
+    input iterator eagerly. With a ledger, verdicts are chained into it by
+    the writer, so ledger order is input order. A post's "media_path" is
+    only read if it lies inside media_dir.
+    """
+    stats = {"records": 0, "verified": 0, "errors": 0, "batches": 0}
+    verdicts: Dict[str, int] = {}
+    started = time.perf_counter()
+
+    def write(rows: List[Dict]) -> None:
+        for row in rows:
+            stats["records"] += 1
+            if "error" in row:
+                stats["errors"] += 1
+            else:
+                stats["verified"] += 1
+                verdicts[row["verdict"]] = verdicts.get(row["verdict"], 0) + 1
+                if ledger is not None:
+                    row["ledger_seq"] = ledger.append(row["evidence_hash"], row, meta={"line": row["line"]})["seq"]
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+        stats["batches"] += 1
+
+    batches = batched(records, batch_size)
+    if workers <= 1:
+        _init_worker(media_dir)
+        for batch in batches:
+            write(verify_batch(batch))
+    else:
+        limit = max_pending or workers * PENDING_PER_WORKER
+        pending = deque()
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(media_dir,)) as pool:
+            for batch in batches:
+                if len(pending) >= limit:
+                    write(pending.popleft().get())
+                pending.append(pool.apply_async(verify_batch, (batch,)))
+            while pending:
+                write(pending.popleft().get())
+
+    if ledger is not None:
+        ledger.sync()
+    elapsed = time.perf_counter() - started
+    return dict(
+        stats,
+        verdicts=verdicts,
+        workers=max(1, workers),
+        batch_size=batch_size,
+        seconds=round(elapsed, 2),
+        records_per_s=round(stats["records"] / elapsed, 1) if elapsed else None
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="JSONL file of posts, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for verdicts (default: stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help=f"batches in flight before reading pauses (default: {PENDING_PER_WORKER} per worker)")
+    parser.add_argument("--ledger", default=None, help="append every verdict to this hash-chained evidence ledger")
+    parser.add_argument("--media-dir", default=None,
+                        help="directory of downloaded media; a post's media_path is read only if it lies inside it")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    ledger = EvidenceLedger(args.ledger) if args.ledger else None
+    try:
+        summary = run_pipeline(read_jsonl(source), out, args.workers, args.batch_size, args.max_pending, ledger,
+                               args.media_dir)
+        if ledger is not None:
+            summary["ledger"] = ledger.snapshot()
+    finally:
+        if ledger is not None:
+            ledger.close()
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Evidence hashing and an append-only verdict ledger for the TECW verification engine
+Streaming SHA-256 of media payloads, canonical hashes of claim metadata, and a hash-chained JSONL log
+
+Each ledger line is {"prev": <hash of the line before>, "entry": {...}, "hash": <hash of this line>},
+so editing, dropping or reordering a record breaks every hash after it.
+
+    python evidence_ledger.py verify data/evidence_ledger.jsonl
+    python evidence_ledger.py head data/evidence_ledger.jsonl
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "evidence_ledger.jsonl")
+CHUNK_SIZE = 1 << 20
+# Claim fields that hold media and are hashed as binary rather than as JSON text
+PAYLOAD_FIELDS = ("image_data", "audio_data", "pixels")
+# Records are written through at once but only fsynced every SYNC_EVERY appends or SYNC_INTERVAL
+# seconds; a crash can lose that tail, but never leaves a gap in the chain
+SYNC_EVERY = 256
+SYNC_INTERVAL = 1.0
+GENESIS = "0" * 64
+
+_PREFIX = b'{"prev":"'
+_HASH_MARKER = b',"hash":"'
+
+
+def canonical_json(value: Any) -> bytes:
+    """Compact, key-sorted UTF-8 JSON: the same metadata always gives the same bytes"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _update(sha, data, chunk_size: int) -> int:
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), chunk_size):
+        sha.update(view[start:start + chunk_size])
+    return len(view)
+
+
+def hash_payload(payload: Any, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    """(SHA-256 hex, size in bytes) of a binary payload, read chunk_size bytes at a time.
+
+    Accepts bytes-like objects (including NumPy arrays), base64 text (data:
+    URLs too; decoded a chunk at a time, never as a whole) and binary file
+    objects. Text that is not valid base64 is hashed as UTF-8.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    if isinstance(payload, str):
+        encoded = payload.split(",", 1)[-1] if payload.startswith("data:") else payload
+        step = chunk_size // 3 * 4  # whole base64 quanta, so chunks decode independently
+        try:
+            for start in range(0, len(encoded), step):
+                size += _update(sha, base64.b64decode(encoded[start:start + step], validate=True), chunk_size)
+        except (binascii.Error, ValueError):
+            sha = hashlib.sha256()
+            size = _update(sha, payload.encode("utf-8"), chunk_size)
+    elif hasattr(payload, "readinto"):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            read = payload.readinto(buffer)
+            if not read:
+                break
+            sha.update(view[:read])
+            size += read
+    else:
+        try:
+            size = _update(sha, payload, chunk_size)
+        except (TypeError, ValueError):  # e.g. a non-contiguous array
+            size = _update(sha, payload.tobytes(), chunk_size)
+    return sha.hexdigest(), size
+
+
+def hash_file(path: str, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    with open(path, "rb", buffering=0) as f:
+        return hash_payload(f, chunk_size)
+
+
+def evidence_hash(content: Dict, media_file: Optional[str] = None) -> str:
+    """SHA-256 of a claim for chain of custody.
+
+    Media payloads are replaced by {"sha256", "bytes"} of their contents, so
+    a multi-megabyte recording is never turned into one JSON string. A
+    media file on disk (passed by the caller, never taken from the claim)
+    is hashed into "media_sha256". Claims without media (all text claims)
+    hash exactly as before: sorted-key json.dumps of the content.
+    """
+    digestible = dict(content)
+    for field in PAYLOAD_FIELDS:
+        value = digestible.get(field)
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        digest, size = hash_payload(value)
+        digestible[field] = {"sha256": digest, "bytes": size}
+        if hasattr(value, "shape"):
+            digestible[field].update(shape=list(value.shape), dtype=str(value.dtype))
+    if media_file is not None:
+        digestible["media_sha256"] = hash_file(media_file)[0]
+    return hashlib.sha256(json.dumps(digestible, sort_keys=True).encode()).hexdigest()
+
+
+def _line_for(prev: str, entry: Dict) -> Tuple[bytes, str]:
+    body = _PREFIX + prev.encode("ascii") + b'","entry":' + canonical_json(entry)
+    digest = hashlib.sha256(body + b"}").hexdigest()
+    return body + _HASH_MARKER + digest.encode("ascii") + b'"}\n', digest
+
+
+class EvidenceLedger:
+    """Append-only, hash-chained log of verdicts.
+
+    A record's hash covers its entry and the previous record's hash; the
+    first record chains from GENESIS. Appends are thread-safe. Lines are
+    written through immediately but fsynced in batches (sync_every records
+    or sync_interval seconds, whichever comes first); call sync() or close()
+    to force the tail to disk. A torn last line left by a crash is cut off
+    when the ledger is reopened.
+    """
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH, sync_every: int = SYNC_EVERY,
+                 sync_interval: float = SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self.head = GENESIS
+        self.seq = 0
+        self._recover()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.stats = {"appended": 0, "fsyncs": 0}
+
+    def _recover(self) -> None:
+        """Pick up seq and head from the last complete line, cutting off a torn one"""
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            tail = b""
+            position = end
+            # Walk back until the tail holds the whole last complete line (and any torn one after it)
+            while position > 0 and tail.count(b"\n") < 2:
+                position = max(0, position - 65536)
+                f.seek(position)
+                tail = f.read(end - position)
+            if not tail.endswith(b"\n"):
+                cut = tail.rfind(b"\n") + 1
+                f.truncate(position + cut)
+                tail = tail[:cut]
+            lines = tail.splitlines()
+            if lines and lines[-1]:
+                record = json.loads(lines[-1])
+                self.head = record["hash"]
+                self.seq = record["entry"]["seq"]
+
+    def append(self, evidence: str, result: Optional[Dict] = None, meta: Optional[Dict] = None) -> Dict:
+        """Record a claim's evidence hash and the verdict given for it; returns {seq, prev, hash}"""
+        result = result or {}
+        with self._lock:
+            entry = {
+                "seq": self.seq + 1,
+                "evidence_hash": evidence,
+                "verdict": result.get("verdict"),
+                "confidence": result.get("confidence"),
+                "recorded_at": datetime.now().isoformat()
+            }
+            if meta:
+                entry["meta"] = meta
+            line, digest = _line_for(self.head, entry)
+            self._file.write(line)
+            record = {"seq": entry["seq"], "prev": self.head, "hash": digest}
+            self.seq = entry["seq"]
+            self.head = digest
+            self.stats["appended"] += 1
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync_locked()
+        return record
+
+    def _sync_locked(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.stats["fsyncs"] += 1
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._unsynced:
+                self._sync_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._unsynced:
+                self._sync_locked()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, path=self.path, seq=self.seq, head=self.head, unsynced=self._unsynced)
+
+
+def verify_ledger(path: str, expected_head: Optional[str] = None) -> Dict:
+    """Check every link of a ledger file; returns {ok, records, head, error, line}.
+
+    Works on the raw bytes of each line (fixed prefix, hash marker last)
+    without decoding JSON, so it runs at hashing speed. Pass a head
+    recorded elsewhere as expected_head to also catch a rewritten tail.
+    """
+    prev = GENESIS
+    records = 0
+    with open(path, "rb", buffering=CHUNK_SIZE) as f:
+        for line_no, line in enumerate(f, 1):
+            marker = line.rfind(_HASH_MARKER)
+            if marker < 0 or not line.startswith(_PREFIX) or not line.endswith(b'"}\n'):
+                return {"ok": False, "records": records, "head": prev, "line": line_no, "error": "malformed or torn record"}
+            if line[9:73] != prev.encode("ascii"):
+                return {"ok": False, "records": records, "head": prev, "line": line_no, "error": "prev does not match the record before"}
+            digest = hashlib.sha256(line[:marker] + b"}").hexdigest()
+            if line[marker + 9:marker + 73] != digest.encode("ascii"):
+                return {"ok": False, "records": records, "head": prev, "line": line_no, "error": "record hash mismatch"}
+            prev = digest
+            records += 1
+    if expected_head is not None and prev != expected_head:
+        return {"ok": False, "records": records, "head": prev, "line": None, "error": "head does not match the expected hash"}
+    return {"ok": True, "records": records, "head": prev, "line": None, "error": None}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect a hash-chained evidence ledger")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("verify", help="Check the whole chain")
+    check.add_argument("ledger", nargs="?", default=DEFAULT_LEDGER_PATH)
+    check.add_argument("--expected-head", default=None)
+    head = sub.add_parser("head", help="Print the last sequence number and hash")
+    head.add_argument("ledger", nargs="?", default=DEFAULT_LEDGER_PATH)
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        started = time.perf_counter()
+        report = verify_ledger(args.ledger, args.expected_head)
+        report["seconds"] = round(time.perf_counter() - started, 2)
+        print(json.dumps(report))
+        raise SystemExit(0 if report["ok"] else 1)
+    with EvidenceLedger(args.ledger) as ledger:
+        print(json.dumps({"seq": ledger.seq, "head": ledger.head}))
@@ -0,0 +1,331 @@
+"""
+Perceptual image hashes and a known-image index for the TECW verification engine
+dHash/pHash of downscaled grayscale pixels, matched by Hamming distance with multi-index hashing
+
+Hashing needs NumPy. JPEG/PNG decoding uses Pillow when it is installed;
+binary PGM/PPM and pre-decoded pixel arrays work without it.
+
+    python image_hash.py add --label scam --description "Fake Orange Money SMS" shot.png
+    python image_hash.py match upload.jpg
+"""
+
+import io
+import itertools
+import json
+import os
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # image matching is optional; text verification works without NumPy
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "image_exemplars.jsonl")
+HASH_BITS = 64
+# Recompressed, resized or re-screenshotted copies usually stay within this many bits
+DEFAULT_MAX_DISTANCE = 10
+LABELS = ("scam", "authentic")
+# A dHash bit is only set if the right-hand cell is brighter by more than this many grey levels,
+# so flat areas (blank screenshot backgrounds) do not flip with noise or recompression
+DHASH_MARGIN = 1.0
+# Multi-index hashing: the 64 bits are searched as four 16-bit blocks
+BLOCKS = 4
+BLOCK_BITS = HASH_BITS // BLOCKS
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+
+def image_hashing_available() -> bool:
+    return np is not None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+@lru_cache(maxsize=None)
+def _probe_masks(radius: int) -> Tuple[int, ...]:
+    """Every BLOCK_BITS-bit mask with at most `radius` bits set"""
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for r in range(radius + 1)
+        for bits in itertools.combinations(range(BLOCK_BITS), r)
+    )
+
+
+def _decode_netpbm(data: bytes):
+    """Binary PGM (P5) / PPM (P6) with 8-bit samples; ValueError on a truncated or malformed file"""
+    fields = []
+    pos = 2
+    end = len(data)
+    while len(fields) < 3:
+        while pos < end and data[pos:pos + 1].isspace():
+            pos += 1
+        if pos >= end:
+            raise ValueError("Truncated PGM/PPM header")
+        if data[pos:pos + 1] == b"#":
+            pos = data.find(b"\n", pos) + 1
+            if not pos:
+                raise ValueError("Truncated PGM/PPM header")
+            continue
+        start = pos
+        while pos < end and not data[pos:pos + 1].isspace():
+            pos += 1
+        if pos >= end:
+            raise ValueError("Truncated PGM/PPM header")
+        field = data[start:pos]
+        if not field.isdigit():
+            raise ValueError("Malformed PGM/PPM header")
+        fields.append(int(field))
+    width, height, maxval = fields
+    if maxval > 255:
+        raise ValueError("16-bit PGM/PPM is not supported")
+    channels = 3 if data[:2] == b"P6" else 1
+    if end - pos - 1 < width * height * channels:
+        raise ValueError("Truncated PGM/PPM pixel data")
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * channels, offset=pos + 1)
+    return pixels.reshape(height, width, channels) if channels == 3 else pixels.reshape(height, width)
+
+
+def load_grayscale(image: Any):
+    """Grayscale float pixels from a file path, encoded bytes or a (H, W[, 3|4]) array"""
+    if not image_hashing_available():
+        raise RuntimeError("NumPy is required for image hashing (pip install numpy)")
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            image = f.read()
+    if isinstance(image, (bytes, bytearray)):
+        data = bytes(image)
+        if data[:2] in (b"P5", b"P6"):
+            pixels = _decode_netpbm(data)
+        elif Image is not None:
+            with Image.open(io.BytesIO(data)) as img:
+                # JPEGs can be decoded straight at reduced scale; hashes only need 32x32
+                img.draft("L", (256, 256))
+                pixels = np.asarray(img.convert("L"))
+        else:
+            raise ValueError("Decoding PNG/JPEG images needs Pillow (pip install pillow)")
+    else:
+        pixels = np.asarray(image)
+
+    pixels = pixels.astype(np.float64)
+    if pixels.ndim == 3:
+        # ITU-R 601 luma, the same weights as Pillow's "L" mode; alpha is ignored
+        pixels = pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+    if pixels.ndim != 2 or 0 in pixels.shape:
+        raise ValueError("Expected a non-empty 2-D image")
+    return pixels
+
+
+def _box_resize(pixels, width: int, height: int):
+    """Downscale by averaging the block of source pixels behind each target pixel"""
+    h, w = pixels.shape
+    if h < height or w < width:
+        pixels = np.repeat(np.repeat(pixels, -(-height // h), axis=0), -(-width // w), axis=1)
+        h, w = pixels.shape
+    rows = np.linspace(0, h, height + 1).astype(int)
+    cols = np.linspace(0, w, width + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(pixels, rows[:-1], axis=0), cols[:-1], axis=1)
+    return sums / np.outer(np.diff(rows), np.diff(cols))
+
+
+def _bits_to_int(bits) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def _dct_matrix(n: int):
+    k = np.arange(n)[:, None]
+    return np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+
+
+_DCT_32 = None
+
+
+def dhash(pixels) -> int:
+    """Difference hash: is the right-hand neighbour of each of 8x8 cells brighter than it"""
+    small = _box_resize(pixels, 9, 8)
+    return _bits_to_int(small[:, 1:] > small[:, :-1] + DHASH_MARGIN)
+
+
+def phash(pixels) -> int:
+    """DCT hash: which of the 8x8 lowest frequencies of a 32x32 thumbnail are above their median"""
+    global _DCT_32
+    if _DCT_32 is None:
+        _DCT_32 = _dct_matrix(32)
+    small = _box_resize(pixels, 32, 32)
+    low = (_DCT_32 @ small @ _DCT_32.T)[:8, :8]
+    # The DC term is overall brightness, which would skew the median
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def image_hashes(image: Any) -> Tuple[int, int]:
+    """(dhash, phash) of an image given as a path, encoded bytes or pixel array"""
+    pixels = load_grayscale(image)
+    return dhash(pixels), phash(pixels)
+
+
+class MultiIndexHash:
+    """Multi-index hashing of 64-bit hashes for Hamming-radius search.
+
+    Each hash is split into four 16-bit blocks, each with its own table. Two
+    hashes within r bits must agree to within r // 4 bits on at least one
+    block (pigeonhole), so a search probes every block value within that
+    many bits of the query's and only checks the hashes filed there.
+    """
+
+    def __init__(self):
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(BLOCKS)]
+        self._keys: List[int] = []
+        self._values: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: int, value: Any) -> None:
+        position = len(self._keys)
+        self._keys.append(key)
+        self._values.append(value)
+        for block, table in enumerate(self._tables):
+            table.setdefault((key >> (BLOCK_BITS * block)) & BLOCK_MASK, []).append(position)
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """(distance, value) for every stored hash within max_distance, nearest first"""
+        masks = _probe_masks(max_distance // BLOCKS)
+        candidates = set()
+        for block, table in enumerate(self._tables):
+            value = (key >> (BLOCK_BITS * block)) & BLOCK_MASK
+            for mask in masks:
+                positions = table.get(value ^ mask)
+                if positions:
+                    candidates.update(positions)
+        found = []
+        for position in candidates:
+            distance = hamming(key, self._keys[position])
+            if distance <= max_distance:
+                found.append((distance, self._values[position]))
+        found.sort(key=lambda hit: hit[0])
+        return found
+
+
+class ImageHashIndex:
+    """Known scam and authentic images, matched by perceptual hash.
+
+    Candidates come from a multi-index table of dHashes and must also be within
+    max_distance on the pHash, which is more robust to recompression and
+    so weeds out chance dHash collisions. With `path` set, exemplars are
+    appended to a JSONL file as they are added and replayed on load.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self._table = MultiIndexHash()
+        self._exemplars: Dict[str, Dict] = {}
+        self.stats = {"lookups": 0, "hits": 0}
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._exemplars)
+
+    def add(self, hashes: Tuple[int, int], label: str, description: str = "", source: Optional[str] = None) -> Dict:
+        """Index an exemplar by its (dhash, phash); returns the stored record"""
+        if label not in LABELS:
+            raise ValueError(f"label must be one of {', '.join(LABELS)}")
+        exemplar = {
+            # Unique across processes: the CLI and running services append to the same file
+            "id": f"img-{uuid.uuid4().hex}",
+            "label": label,
+            "description": description,
+            "source": source,
+            "dhash": f"{hashes[0]:016x}",
+            "phash": f"{hashes[1]:016x}",
+            "added_at": time.time()
+        }
+        self._insert(exemplar)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(exemplar) + "\n")
+        return exemplar
+
+    def add_image(self, image: Any, label: str, description: str = "", source: Optional[str] = None) -> Dict:
+        return self.add(image_hashes(image), label, description, source)
+
+    def match(self, hashes: Tuple[int, int], max_distance: Optional[int] = None) -> List[Dict]:
+        """Exemplars within max_distance bits on both hashes, closest first"""
+        limit = self.max_distance if max_distance is None else max_distance
+        self.stats["lookups"] += 1
+        matches = []
+        for d_distance, exemplar_id in self._table.search(hashes[0], limit):
+            exemplar = self._exemplars[exemplar_id]
+            p_distance = hamming(hashes[1], int(exemplar["phash"], 16))
+            if p_distance > limit:
+                continue
+            matches.append({
+                "id": exemplar["id"],
+                "label": exemplar["label"],
+                "description": exemplar["description"],
+                "source": exemplar["source"],
+                "distance": max(d_distance, p_distance),
+                "dhash_distance": d_distance,
+                "phash_distance": p_distance
+            })
+        matches.sort(key=lambda m: (m["distance"], m["dhash_distance"] + m["phash_distance"]))
+        if matches:
+            self.stats["hits"] += 1
+        return matches
+
+    def snapshot(self) -> Dict:
+        labels = {label: 0 for label in LABELS}
+        for exemplar in self._exemplars.values():
+            labels[exemplar["label"]] += 1
+        return dict(self.stats, exemplars=len(self._exemplars), max_distance=self.max_distance, **labels)
+
+    def _insert(self, exemplar: Dict) -> None:
+        self._exemplars[exemplar["id"]] = exemplar
+        self._table.add(int(exemplar["dhash"], 16), exemplar["id"])
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        exemplar = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line from a crash
+                    if exemplar.get("id") and exemplar.get("dhash") and exemplar.get("phash"):
+                        self._insert(exemplar)
+        except FileNotFoundError:
+            return
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Manage the index of known scam and authentic images")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="Add exemplar images")
+    add.add_argument("--label", choices=LABELS, required=True)
+    add.add_argument("--description", default="")
+    add.add_argument("images", nargs="+")
+    match = sub.add_parser("match", help="Look up images in the index")
+    match.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE)
+    match.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    index = ImageHashIndex(args.index)
+    for path in args.images:
+        if args.command == "add":
+            exemplar = index.add_image(path, args.label, args.description or os.path.basename(path), source=path)
+            print(json.dumps(exemplar))
+        else:
+            print(json.dumps({"image": path, "matches": index.match(image_hashes(path), args.max_distance)}))
@@ -0,0 +1,102 @@
+"""
+Multi-pattern phrase matcher for the TECW verification engine
+Aho-Corasick automaton with word-boundary checks, built once and matched in a single pass
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class PatternMatcher:
+    """Finds every occurrence of many phrases in one linear scan of the text.
+
+    Matching is case-insensitive and only whole words/phrases count, so
+    "un" does not fire inside "fund".
+    """
+
+    def __init__(self, patterns: Optional[Iterable[Tuple[str, str]]] = None):
+        # Trie nodes: transitions, failure link, and ids of patterns ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self._patterns: List[Tuple[str, str]] = []  # (phrase, category)
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._built = True
+        for phrase, category in patterns or []:
+            self.add(phrase, category)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, phrase: str, category: str = "pattern") -> None:
+        phrase = phrase.lower().strip()
+        if not phrase or (phrase, category) in self._ids:
+            return
+        pattern_id = len(self._patterns)
+        self._patterns.append((phrase, category))
+        self._ids[(phrase, category)] = pattern_id
+
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._output[node].append(pattern_id)
+        self._built = False
+
+    def build(self) -> None:
+        """Compute failure links (breadth-first); called automatically before matching"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # Inherit matches of the longest proper suffix
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def find_all(self, text: str) -> List[Dict]:
+        """Every whole-word match as {"pattern", "category", "start", "end"}, in text order"""
+        if not self._built:
+            self.build()
+        text_lower = text.lower()
+        length = len(text_lower)
+        goto, fail, output = self._goto, self._fail, self._output
+
+        matches = []
+        node = 0
+        for i, ch in enumerate(text_lower):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not output[node]:
+                continue
+            end = i + 1
+            # Boundaries only apply where the phrase itself starts/ends with a word character
+            if _is_word_char(ch) and end < length and _is_word_char(text_lower[end]):
+                continue
+            for pattern_id in output[node]:
+                phrase, category = self._patterns[pattern_id]
+                start = end - len(phrase)
+                if start > 0 and _is_word_char(phrase[0]) and _is_word_char(text_lower[start - 1]):
+                    continue
+                matches.append({"pattern": phrase, "category": category, "start": start, "end": end})
+        matches.sort(key=lambda m: (m["start"], -m["end"]))
+        return matches
@@ -0,0 +1,27 @@
+"""
+Regression checks for the bulk verification pipeline
+Run with pytest, or directly: python test_bulk_verify.py
+"""
+
+import io
+import json
+
+from bulk_verify import normalize, read_jsonl, run_pipeline
+
+SCAM_CAPTION = "Orange Money: you have won Le 5,000,000! Send your PIN to claim"
+
+
+def test_caption_only_image_is_flagged():
+    content = normalize({"type": "image", "caption": SCAM_CAPTION})
+    assert content["caption"] == SCAM_CAPTION
+
+    out = io.StringIO()
+    run_pipeline(read_jsonl([json.dumps({"id": 1, "type": "image", "caption": SCAM_CAPTION}) + "\n"]), out)
+    row = json.loads(out.getvalue())
+    assert "Potential fake banking message" in row["forensics"]["indicators"]
+    assert row["verdict"] != "UNVERIFIED"
+
+
+if __name__ == "__main__":
+    test_caption_only_image_is_flagged()
+    print("ok")
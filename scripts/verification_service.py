@@ -3,13 +3,32 @@ TECW Verification Microservice
 Python-based AI verification engine
 """
 
+import base64
+import binascii
 import json
-import hashlib
+import os
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
+
+from audio_fingerprint import DEFAULT_INDEX_DIR, AudioFingerprintIndex, fingerprint
+from evidence_ledger import EvidenceLedger, evidence_hash
+from image_hash import DEFAULT_INDEX_PATH, ImageHashIndex, image_hashes
+from pattern_matcher import PatternMatcher
+
+# Words that point a claim at a trusted source, keyed by matcher category
+SOURCE_TRIGGERS = {
+    "source:statehouse": ["government", "president"],
+    "source:who": ["ebola", "health"]
+}
+
+# An authentic exemplar only confirms an image this close to it; a slightly
+# further match is more likely an edited copy (e.g. a doctored letterhead)
+AUTHENTIC_MATCH_DISTANCE = 3
 
 class VerificationService:
-    def __init__(self):
+    def __init__(self, scam_patterns: Optional[List[str]] = None, verdict_index: Optional[Any] = None,
+                 image_index: Optional[ImageHashIndex] = None, audio_index: Optional[AudioFingerprintIndex] = None,
+                 ledger: Optional[EvidenceLedger] = None, media_dir: Optional[str] = None):
         self.trusted_sources = [
             {
                 "domain": "statehouse.gov.sl",
@@ -35,16 +54,70 @@ class VerificationService:
             "account suspended",
             "verify your account"
         ]
-    
-    def verify_claim(self, content: Dict) -> Dict:
-        """Main verification method"""
-        
+        if scam_patterns:
+            self.scam_patterns.extend(scam_patterns)
+
+        # Compiled once per instance: scam phrases, source triggers and the
+        # entities used by the verdict rules are all found in a single pass
+        self.matcher = PatternMatcher()
+        for pattern in self.scam_patterns:
+            self.matcher.add(pattern, "scam")
+        for category, words in SOURCE_TRIGGERS.items():
+            for word in words:
+                self.matcher.add(word, category)
+        self.matcher.add("president", "entity:president")
+        self.matcher.add("un", "entity:un")
+        self.matcher.add("united nations", "entity:un")
+        self.matcher.build()
+
+        # Optional near-duplicate index (lookup/add, e.g. NearDuplicateIndex from
+        # simple-chatbot/near_duplicates.py): reworded copies of a verified text
+        # claim reuse its verdict instead of being verified again
+        self.verdict_index = verdict_index
+
+        # Perceptual hashes of known scam and authentic images (see image_hash.py)
+        self.image_index = image_index if image_index is not None else ImageHashIndex(DEFAULT_INDEX_PATH)
+        # Fingerprints of voice notes already reviewed by a human (see audio_fingerprint.py)
+        self.audio_index = audio_index if audio_index is not None else AudioFingerprintIndex(DEFAULT_INDEX_DIR)
+        # Optional hash-chained log of every verdict given (see evidence_ledger.py)
+        self.ledger = ledger
+        # Claim content is untrusted (scraped posts), so it never names local files; media already on
+        # disk is passed separately as media_path and must lie inside this directory
+        self.media_dir = os.path.realpath(media_dir) if media_dir else None
+
+    def media_file(self, media_path: Optional[str]) -> Optional[str]:
+        """Resolve media_path (absolute, or relative to media_dir) to a file inside media_dir"""
+        if media_path is None:
+            return None
+        if self.media_dir is None:
+            raise ValueError("Local media files need a media_dir")
+        resolved = os.path.realpath(os.path.join(self.media_dir, media_path))
+        if os.path.commonpath([resolved, self.media_dir]) != self.media_dir:
+            raise ValueError(f"{media_path} is outside the media directory")
+        return resolved
+
+    def verify_claim(self, content: Dict, media_path: Optional[str] = None) -> Dict:
+        """Main verification method.
+
+        Images and recordings come from content as bytes, base64 or data:
+        URLs; media_path names a file under media_dir instead.
+        """
+        media = self.media_file(media_path)
+        result = self._verify_claim(content, media)
+        if self.ledger is not None:
+            evidence = self.calculate_evidence_hash(content, media_path)
+            record = self.ledger.append(evidence, result, meta={"type": content.get("type")})
+            result["evidence_hash"] = evidence
+            result["ledger"] = record
+        return result
+
+    def _verify_claim(self, content: Dict, media: Optional[str] = None) -> Dict:
         if content["type"] == "text":
-            return self._verify_text(content["text"])
+            return self._verify_text_cached(content["text"])
         elif content["type"] == "image":
-            return self._verify_image(content)
+            return self._verify_image(content, media)
         elif content["type"] == "audio":
-            return self._verify_audio(content)
+            return self._verify_audio(content, media)
         else:
             return {
                 "verdict": "UNVERIFIED",
@@ -53,20 +126,33 @@ class VerificationService:
                 "matched_sources": []
             }
     
+    def _verify_text_cached(self, text: str) -> Dict:
+        """Verify text, reusing the verdict of a near-duplicate claim when one is indexed"""
+        if self.verdict_index is None:
+            return self._verify_text(text)
+        match = self.verdict_index.lookup(text)
+        if match:
+            result = dict(match["verdict"])
+            result["near_duplicate_of"] = dict(match["original"], similarity=match["similarity"])
+            return result
+        result = self._verify_text(text)
+        # Match offsets refer to this exact text, so they are not reused
+        self.verdict_index.add(text, {k: v for k, v in result.items() if k != "pattern_matches"})
+        return result
+
     def _verify_text(self, text: str) -> Dict:
         """Verify text-based claim"""
         
-        text_lower = text.lower()
+        matches = self.matcher.find_all(text)
+        categories = {m["category"] for m in matches}
         
         # Check for scam patterns
-        scam_score = 0
-        for pattern in self.scam_patterns:
-            if pattern in text_lower:
-                scam_score += 0.3
+        scam_matches = [m for m in matches if m["category"] == "scam"]
+        scam_score = 0.3 * len({m["pattern"] for m in scam_matches})
         
         # Simulate source checking
         matched_sources = []
-        if "government" in text_lower or "president" in text_lower:
+        if "source:statehouse" in categories:
             matched_sources.append({
                 "url": "https://statehouse.gov.sl/press-releases",
                 "title": "State House Official Press Releases",
@@ -74,7 +160,7 @@ class VerificationService:
                 "last_checked": datetime.now().isoformat()
             })
         
-        if "ebola" in text_lower or "health" in text_lower:
+        if "source:who" in categories:
             matched_sources.append({
                 "url": "https://who.int/countries/sle",
                 "title": "WHO Sierra Leone",
@@ -90,10 +176,11 @@ class VerificationService:
             verdict = "FALSE"
             reasoning = [
                 "Message contains multiple scam indicators",
+                *[f"Scam indicator \"{m['pattern']}\" at characters {m['start']}-{m['end']}" for m in scam_matches],
                 "No official announcement from government sources",
                 "Similar scams debunked previously"
             ]
-        elif "president" in text_lower and "un" in text_lower:
+        elif "entity:president" in categories and "entity:un" in categories:
             verdict = "TRUE"
             confidence = 0.95
             reasoning = [
@@ -119,56 +206,170 @@ class VerificationService:
             "confidence": round(confidence, 2),
             "reasoning": reasoning,
             "matched_sources": matched_sources,
+            "pattern_matches": matches,
             "timestamp": datetime.now().isoformat()
         }
     
-    def _verify_image(self, content: Dict) -> Dict:
+    def _verify_image(self, content: Dict, media: Optional[str] = None) -> Dict:
         """Verify image-based claim"""
         
         # Simulate OCR extraction
         ocr_text = content.get("caption", "")
         
-        # Simulate forensic analysis
         forensic_indicators = []
         if "orange money" in ocr_text.lower():
             forensic_indicators.append("Potential fake banking message")
-        
-        confidence = 0.85 if forensic_indicators else 0.50
+
+        reasoning = ["OCR analysis completed"]
+        fingerprint = None
+        matches = []
+        image = _image_input(content, media)
+        if image is not None:
+            try:
+                hashes = image_hashes(image)
+            except (ValueError, RuntimeError, OSError) as e:
+                reasoning.append(f"Image could not be fingerprinted: {e}")
+            else:
+                fingerprint = {"dhash": f"{hashes[0]:016x}", "phash": f"{hashes[1]:016x}"}
+                matches = self.image_index.match(hashes)
+                reasoning.append(f"Compared against {len(self.image_index)} known images")
+
+        scam = [m for m in matches if m["label"] == "scam"]
+        authentic = [m for m in matches if m["label"] == "authentic"]
+        if scam:
+            best = scam[0]
+            verdict = "FALSE"
+            confidence = max(0.85, 0.99 - 0.01 * best["distance"])
+            forensic_indicators.append(f"Matches known scam image \"{best['description']}\" ({best['distance']}/64 bits differ)")
+        elif authentic and authentic[0]["distance"] <= AUTHENTIC_MATCH_DISTANCE:
+            best = authentic[0]
+            verdict = "TRUE"
+            confidence = 0.9
+            reasoning.append(f"Matches authentic image \"{best['description']}\"")
+        elif authentic:
+            best = authentic[0]
+            verdict = "MISLEADING"
+            confidence = 0.7
+            forensic_indicators.append(
+                f"Resembles authentic image \"{best['description']}\" but {best['distance']}/64 bits differ: possibly altered"
+            )
+        else:
+            verdict = "FALSE" if forensic_indicators else "UNVERIFIED"
+            confidence = 0.85 if forensic_indicators else 0.50
         
         return {
-            "verdict": "FALSE" if forensic_indicators else "UNVERIFIED",
-            "confidence": confidence,
+            "verdict": verdict,
+            "confidence": round(confidence, 2),
             "reasoning": [
-                "OCR analysis completed",
+                *reasoning,
                 *forensic_indicators,
                 "Image metadata examined"
             ],
             "matched_sources": [],
             "forensics": {
                 "ocr_text": ocr_text,
-                "indicators": forensic_indicators
+                "indicators": forensic_indicators,
+                "perceptual_hash": fingerprint,
+                "matched_images": matches
             }
         }
+
+    def add_image_exemplar(self, content: Dict, label: str, description: str = "",
+                           media_path: Optional[str] = None) -> Dict:
+        """Remember an adjudicated image ("scam" or "authentic") so copies of it are recognised"""
+        image = _image_input(content, self.media_file(media_path))
+        if image is None:
+            raise ValueError("No image_data or pixels in content, and no media_path")
+        return self.image_index.add_image(image, label, description, source=media_path)
     
-    def _verify_audio(self, content: Dict) -> Dict:
+    def _verify_audio(self, content: Dict, media: Optional[str] = None) -> Dict:
         """Verify audio-based claim"""
-        
+
+        # Re-forwarded voice notes inherit the verdict given to the original
+        audio = _audio_input(content, media)
+        fingerprint_info = None
+        matches = []
+        problem = None
+        if audio is not None:
+            try:
+                hashes, duration = fingerprint(audio)
+            except (ValueError, RuntimeError, OSError) as e:
+                problem = f"Audio could not be fingerprinted: {e}"
+            else:
+                fingerprint_info = {"hashes": int(len(hashes)), "duration_s": round(duration, 2)}
+                matches = self.audio_index.match(hashes)
+
+        if matches:
+            best = matches[0]
+            return {
+                "verdict": best["verdict"],
+                "confidence": round(min(0.95, 0.75 + best["score"]), 2),
+                "reasoning": [
+                    f"Recording matches previously reviewed voice note \"{best['description']}\" "
+                    f"({best['aligned_hashes']} aligned fingerprint hashes, offset {best['offset_s']}s)",
+                    "Verdict carried over from the earlier human review"
+                ],
+                "matched_sources": [],
+                "forensics": {"fingerprint": fingerprint_info, "matched_recordings": matches}
+            }
+
         # Simulate transcription
+        reasoning = [
+            "Audio transcription completed",
+            "Language detected: Krio",
+            "Requires human review for verification"
+        ]
+        if problem:
+            reasoning.insert(0, problem)
+        elif fingerprint_info:
+            reasoning.insert(0, f"No match among {len(self.audio_index)} reviewed recordings")
         return {
             "verdict": "UNVERIFIED",
             "confidence": 0.45,
-            "reasoning": [
-                "Audio transcription completed",
-                "Language detected: Krio",
-                "Requires human review for verification"
-            ],
-            "matched_sources": []
+            "reasoning": reasoning,
+            "matched_sources": [],
+            "forensics": {"fingerprint": fingerprint_info, "matched_recordings": []}
         }
+
+    def add_audio_exemplar(self, content: Dict, verdict: str, description: str = "",
+                           media_path: Optional[str] = None) -> Dict:
+        """Record the human verdict on a voice note so re-forwards of it are answered automatically"""
+        audio = _audio_input(content, self.media_file(media_path))
+        if audio is None:
+            raise ValueError("No audio_data in content, and no media_path")
+        return self.audio_index.add_recording(audio, verdict, description, name=media_path)
     
-    def calculate_evidence_hash(self, content: Dict) -> str:
+    def calculate_evidence_hash(self, content: Dict, media_path: Optional[str] = None) -> str:
         """Generate hash for evidence chain of custody"""
-        content_str = json.dumps(content, sort_keys=True)
-        return hashlib.sha256(content_str.encode()).hexdigest()
+        return evidence_hash(content, self.media_file(media_path))
+
+
+def _image_input(content: Dict, media: Optional[str] = None) -> Optional[Any]:
+    """The image of an image claim: "pixels" (decoded), "image_data" (bytes or base64), else the trusted media file"""
+    if content.get("pixels") is not None:
+        return content["pixels"]
+    data = content.get("image_data")
+    if isinstance(data, str):
+        try:
+            return base64.b64decode(data.split(",", 1)[-1], validate=True)  # also accepts data: URLs
+        except (binascii.Error, ValueError):
+            return None
+    if isinstance(data, (bytes, bytearray)) and data:
+        return data
+    return media
+
+
+def _audio_input(content: Dict, media: Optional[str] = None) -> Optional[Any]:
+    """The recording of an audio claim: "audio_data" (WAV bytes or base64), else the trusted media file"""
+    data = content.get("audio_data")
+    if isinstance(data, str):
+        try:
+            return base64.b64decode(data.split(",", 1)[-1], validate=True)
+        except (binascii.Error, ValueError):
+            return None
+    if isinstance(data, (bytes, bytearray)) and data:
+        return data
+    return media
 
 
 # Example usage
@@ -0,0 +1,217 @@
+"""
+Admission control for the Truth Engine worker
+Bounded priority queues per request class, per-request deadlines and early load shedding
+
+    scheduler = Scheduler({"emergency": (0, 256, 20), "research": (5, 64, 90)}, workers=64)
+    scheduler.start()
+    scheduler.submit("research", lambda: loop.submit(answer(...)), lambda reason: reply_offline(reason))
+"""
+
+import contextvars
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from metrics import record
+
+# Smoothing for the running mean of service time used to predict queue waits
+SERVICE_TIME_ALPHA = 0.1
+
+# Threads that start jobs; a job that hands its work to an event loop holds a worker slot, not a thread
+DISPATCH_THREADS = 4
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def time_left(default):
+    """Seconds left before the current request's deadline, capped at default"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(0.0, min(default, deadline - time.monotonic()))
+
+
+class _Job:
+    __slots__ = ("request_class", "fn", "on_shed", "enqueued", "deadline", "context")
+
+    def __init__(self, request_class, fn, on_shed, deadline):
+        self.request_class = request_class
+        self.fn = fn
+        self.on_shed = on_shed
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + deadline
+        self.context = contextvars.copy_context()
+
+
+class Scheduler:
+    """Runs up to `workers` jobs at a time, highest priority class first.
+
+    classes maps a class name to (priority, max queued, deadline seconds);
+    lower priorities run first and a class only gets a worker when every
+    higher one is empty. A job that returns a concurrent.futures.Future
+    (work it handed to an event loop) keeps its worker until the future
+    is done, while the dispatch thread that started it moves on; so
+    `workers` bounds the requests in flight, not the threads. A job is
+    shed instead of run, with on_shed(reason) called in its place, when:
+
+    - "queue_full": its class already has max queued jobs waiting
+    - "overloaded": the jobs running and queued at its priority or above
+      would, at the recent mean service time, keep every worker busy past
+      its deadline
+    - "expired": it reached a worker after its deadline
+
+    The first two are decided in submit(), on the caller's thread, so a
+    spike is answered at once rather than after a wait it would not survive.
+    """
+
+    def __init__(self, classes, workers=64, threads=DISPATCH_THREADS):
+        self.classes = dict(classes)
+        self.workers = workers
+        self.threads = threads
+        self._queues = {name: deque() for name in self.classes}
+        # Highest priority first, for the workers' pick
+        self._order = sorted(self.classes, key=lambda name: self.classes[name][0])
+        self._cond = threading.Condition()
+        self._threads = []
+        self._busy = 0
+        self._service_time = None
+        self._stopping = False
+        self.stats = {name: {"admitted": 0, "completed": 0, "queue_full": 0, "overloaded": 0, "expired": 0}
+                      for name in self.classes}
+
+    def start(self, workers=None):
+        with self._cond:
+            if self._threads:
+                return
+            if workers:
+                self.workers = workers
+            self._stopping = False
+            for i in range(min(self.workers, self.threads)):
+                thread = threading.Thread(target=self._work, name=f"scheduler-{i}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self):
+        """Let the workers finish what is queued and in flight, then end them"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._cond:
+            self._cond.wait_for(lambda: self._busy == 0)
+
+    def submit(self, request_class, fn, on_shed, deadline=None):
+        """Queue fn() to run under request_class; returns False (after calling on_shed) if it was shed.
+
+        deadline (seconds) can only shorten the class deadline.
+        """
+        priority, max_queued, class_deadline = self.classes[request_class]
+        deadline = class_deadline if deadline is None else min(deadline, class_deadline)
+        reason = None
+        with self._cond:
+            queue = self._queues[request_class]
+            if len(queue) >= max_queued:
+                reason = "queue_full"
+            elif self._service_time is not None:
+                # Jobs that get a worker before this one, beyond the workers there are
+                ahead = sum(len(self._queues[name]) for name in self._order if self.classes[name][0] <= priority)
+                excess = ahead + self._busy + 1 - self.workers
+                if excess > 0 and excess * self._service_time / self.workers > deadline:
+                    reason = "overloaded"
+            if reason is None:
+                queue.append(_Job(request_class, fn, on_shed, deadline))
+                self.stats[request_class]["admitted"] += 1
+                self._cond.notify()
+            else:
+                self.stats[request_class][reason] += 1
+        if reason is not None:
+            record("queue_wait", 0.0, mode=request_class, outcome=reason)
+            on_shed(reason)
+            return False
+        return True
+
+    def _next(self):
+        for name in self._order:
+            if self._queues[name]:
+                return self._queues[name].popleft()
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next() if self._busy < self.workers else None
+                while job is None:
+                    if self._stopping and not any(self._queues.values()):
+                        return
+                    self._cond.wait()
+                    job = self._next() if self._busy < self.workers else None
+                self._busy += 1
+            started = time.monotonic()
+            pending = None
+            try:
+                pending = self._run(job, started)
+            finally:
+                if pending is None:
+                    self._finish(job, started)
+                else:
+                    pending.add_done_callback(lambda future, job=job, started=started: self._finish(job, started))
+
+    def _run(self, job, started):
+        """Start the job; returns the Future it is still running under, if any"""
+        waited = started - job.enqueued
+        if started >= job.deadline:
+            with self._cond:
+                self.stats[job.request_class]["expired"] += 1
+            record("queue_wait", waited, mode=job.request_class, outcome="expired")
+            job.context.run(job.on_shed, "expired")
+            return None
+        record("queue_wait", waited, mode=job.request_class, outcome="ok")
+
+        def run():
+            # Work the job submits to an event loop from here copies this context, deadline included
+            _deadline.set(job.deadline)
+            return job.fn()
+
+        try:
+            pending = job.context.run(run)
+        except Exception as e:  # the job should reply on its own; never lose the worker thread
+            sys.stderr.write(f"Scheduler job failed: {e}\n")
+            return None
+        return pending if isinstance(pending, Future) else None
+
+    def _finish(self, job, started):
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._busy -= 1
+            if job.deadline > started:  # expired jobs never ran, so they say nothing about service time
+                self.stats[job.request_class]["completed"] += 1
+                self._service_time = elapsed if self._service_time is None else (
+                    self._service_time + SERVICE_TIME_ALPHA * (elapsed - self._service_time))
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            classes = {}
+            for name in self._order:
+                priority, max_queued, deadline = self.classes[name]
+                queue = self._queues[name]
+                classes[name] = dict(
+                    self.stats[name],
+                    priority=priority,
+                    queued=len(queue),
+                    max_queued=max_queued,
+                    deadline_s=deadline,
+                    oldest_wait_ms=round((now - queue[0].enqueued) * 1000, 1) if queue else None
+                )
+            return {
+                "workers": self.workers,
+                "busy": self._busy,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "service_time_ms": round(self._service_time * 1000, 1) if self._service_time is not None else None,
+                "classes": classes
+            }
@@ -0,0 +1,468 @@
+"""
+Asyncio HTTP client for the LLM providers
+Keep-alive HTTP/1.1 over stdlib asyncio streams, streamed (Server-Sent Events) replies,
+a shared event loop thread for blocking callers, and per-provider caps on requests
+in flight and request rate
+
+    client = AsyncProviderClient()
+    loop = EventLoopThread()
+    reply = loop.run(client.post_json(url, payload, headers))
+"""
+
+import asyncio
+import gzip
+import json
+import ssl
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from provider_client import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, ProviderHTTPError, ProviderResponse
+
+DEFAULT_POOL_SIZE = 64
+DEFAULT_CONCURRENCY = 64
+
+
+class StaleConnection(ConnectionError):
+    """A pooled connection was closed by the server while idle"""
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncProviderClient:
+    """HTTP client for coroutines on one event loop; reuses connections per host.
+
+    Pools and counters are only touched from the loop, so there is no
+    locking; stats() may be read from any thread.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self._idle = defaultdict(list)  # (scheme, host, port) -> idle connections, most recent last
+        self._ssl = None
+        self.requests = 0
+        self.reused = 0
+        self.opened = 0
+
+    async def _acquire(self, key):
+        """Return (connection, reused)"""
+        idle = self._idle[key]
+        while idle:
+            conn = idle.pop()
+            if not conn.reader.at_eof():
+                return conn, True
+            conn.close()
+        scheme, host, port = key
+        context = None
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, server_hostname=host if context else None),
+            self.connect_timeout
+        )
+        self.opened += 1
+        return _Connection(reader, writer), False
+
+    def _release(self, key, conn):
+        idle = self._idle[key]
+        if len(idle) < self.pool_size:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def _message(self, method, url, body, headers):
+        """(pool key, request bytes) for one HTTP/1.1 request"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request_headers = {
+            "Host": parts.netloc,
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip",
+            "Content-Length": str(len(body or b""))
+        }
+        request_headers.update(headers or {})
+        head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in request_headers.items()) + "\r\n"
+        return key, head.encode("latin-1") + (body or b"")
+
+    async def request(self, method, url, body=None, headers=None, read_timeout=None):
+        key, message = self._message(method, url, body, headers)
+
+        for attempt in range(2):
+            conn, reused = await self._acquire(key)
+            try:
+                status, response_headers, data, keep_alive = await asyncio.wait_for(
+                    self._exchange(conn, message, method), read_timeout or self.read_timeout
+                )
+            except (StaleConnection, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if keep_alive:
+                self._release(key, conn)
+            else:
+                conn.close()
+            self.requests += 1
+            self.reused += int(reused)
+            if response_headers.get("content-encoding", "").lower() == "gzip":
+                data = gzip.decompress(data)
+            return ProviderResponse(status, response_headers, data)
+
+    async def open_stream(self, url, payload, headers=None, read_timeout=None):
+        """POST a JSON body and return an AsyncStreamingResponse for reading the reply incrementally.
+
+        Raises ProviderHTTPError on non-2xx. read_timeout bounds each read,
+        not the whole stream.
+        """
+        request_headers = {"Content-Type": "application/json", "Accept": "text/event-stream, application/json",
+                           "Accept-Encoding": "identity"}
+        request_headers.update(headers or {})
+        key, message = self._message("POST", url, json.dumps(payload).encode("utf-8"), request_headers)
+        read_timeout = read_timeout or self.read_timeout
+
+        for attempt in range(2):
+            conn, reused = await self._acquire(key)
+            try:
+                conn.writer.write(message)
+                await conn.writer.drain()
+                status, response_headers, keep_alive = await asyncio.wait_for(self._read_head(conn.reader), read_timeout)
+            except (StaleConnection, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            stream = AsyncStreamingResponse(self, key, conn, reused, status, response_headers, keep_alive, read_timeout)
+            if status >= 400:
+                raise ProviderHTTPError(status, (await stream.read()).decode("utf-8", "replace"))
+            return stream
+
+    def _finish(self, key, conn, reused, reusable):
+        if reusable:
+            self._release(key, conn)
+        else:
+            conn.close()
+        self.requests += 1
+        self.reused += int(reused)
+
+    async def _read_head(self, reader):
+        """Read the status line and headers; returns (status, headers, keep_alive)"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise StaleConnection("connection closed before the response")
+        version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return int(status), headers, keep_alive
+
+    async def _exchange(self, conn, message, method):
+        """Send one request and read the whole reply; returns (status, headers, body, keep_alive)"""
+        conn.writer.write(message)
+        await conn.writer.drain()
+
+        status, headers, keep_alive = await self._read_head(conn.reader)
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = await self._read_chunked(conn.reader)
+        elif "content-length" in headers:
+            body = await conn.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await conn.reader.read()
+            keep_alive = False
+        return status, headers, body, keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip trailers up to the blank line that ends the message
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    async def post_json(self, url, payload, headers=None, read_timeout=None):
+        """POST a JSON body and return the decoded JSON reply; raises ProviderHTTPError on non-2xx"""
+        request_headers = {"Content-Type": "application/json"}
+        request_headers.update(headers or {})
+        resp = await self.request("POST", url, json.dumps(payload).encode("utf-8"), request_headers, read_timeout)
+        if resp.status >= 400:
+            raise ProviderHTTPError(resp.status, resp.body.decode("utf-8", "replace"))
+        return resp.json()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "reused": self.reused,
+            "connections_opened": self.opened,
+            "idle_connections": sum(len(idle) for idle in list(self._idle.values()))
+        }
+
+    async def close(self):
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().close()
+
+
+class AsyncStreamingResponse:
+    """A response body read on the loop as it arrives; the connection returns to the pool once fully read"""
+
+    def __init__(self, client, key, conn, reused, status, headers, keep_alive, read_timeout):
+        self.status = status
+        self.content_type = headers.get("content-type", "")
+        self._client = client
+        self._key = key
+        self._conn = conn
+        self._reused = reused
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self._length = int(headers["content-length"]) if "content-length" in headers else None
+        self._keep_alive = keep_alive and (self._chunked or self._length is not None)
+        self._read_timeout = read_timeout
+        self._done = False
+
+    def _read(self, awaitable):
+        return asyncio.wait_for(awaitable, self._read_timeout)
+
+    async def _body(self):
+        """Yield the body in pieces as they arrive, undoing chunked encoding"""
+        reader = self._conn.reader
+        if self._chunked:
+            while True:
+                size = int((await self._read(reader.readline())).split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await self._read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                yield await self._read(reader.readexactly(size))
+                await self._read(reader.readline())
+        elif self._length is not None:
+            left = self._length
+            while left:
+                data = await self._read(reader.read(min(left, 65536)))
+                if not data:
+                    raise ConnectionResetError("connection closed in the middle of the body")
+                left -= len(data)
+                yield data
+        else:
+            while True:
+                data = await self._read(reader.read(65536))
+                if not data:
+                    return
+                yield data
+
+    async def iter_lines(self):
+        clean = False
+        pending = b""
+        try:
+            async for data in self._body():
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    yield line.decode("utf-8").rstrip("\r")
+            if pending:
+                yield pending.decode("utf-8").rstrip("\r")
+            clean = True
+        finally:
+            self._close(clean)
+
+    async def read(self):
+        try:
+            data = b"".join([data async for data in self._body()])
+        except BaseException:
+            self._close(False)
+            raise
+        self._close(True)
+        return data
+
+    def close(self):
+        """Abandon the rest of the body; the connection cannot be reused"""
+        self._close(False)
+
+    def _close(self, clean):
+        if not self._done:
+            self._done = True
+            self._client._finish(self._key, self._conn, self._reused, clean and self._keep_alive)
+
+
+async def aiter_sse_data(lines):
+    """iter_sse_data for an async iterator of lines"""
+    data = []
+    async for line in lines:
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield "\n".join(data)
+
+
+class ProviderLimiter:
+    """Caps the requests in flight to each provider; callers beyond the cap queue for a slot"""
+
+    def __init__(self, limit=DEFAULT_CONCURRENCY):
+        self.limit = limit
+        self._slots = {}
+        self.in_flight = defaultdict(int)
+        self.waiting = defaultdict(int)
+        self.peak = defaultdict(int)
+
+    @asynccontextmanager
+    async def slot(self, name, timeout=None):
+        """Hold one of the provider's slots for the block; raises asyncio.TimeoutError
+        if none frees up within timeout seconds"""
+        semaphore = self._slots.get(name)
+        if semaphore is None:
+            semaphore = self._slots[name] = asyncio.Semaphore(self.limit)
+        self.waiting[name] += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        finally:
+            self.waiting[name] -= 1
+        self.in_flight[name] += 1
+        self.peak[name] = max(self.peak[name], self.in_flight[name])
+        try:
+            yield
+        finally:
+            self.in_flight[name] -= 1
+            semaphore.release()
+
+    def snapshot(self):
+        return {
+            name: {"limit": self.limit, "in_flight": self.in_flight[name], "waiting": self.waiting[name], "peak": self.peak[name]}
+            for name in list(self._slots)
+        }
+
+
+class ProviderRateLimiter:
+    """Token bucket per provider: on average `rate` requests a second, bursts of up to `burst`.
+
+    Tokens are reserved, so callers over the rate queue up in order by
+    sleeping for their turn; a caller whose turn is further away than its
+    timeout gets asyncio.TimeoutError at once instead. Providers without a
+    rate are not limited. Only touched from the event loop.
+    """
+
+    def __init__(self, rates=None, burst=None):
+        self.rates = {name.lower(): rate for name, rate in (rates or {}).items() if rate > 0}
+        self.burst = burst
+        self._buckets = {}  # name -> (tokens, as of monotonic time); tokens < 0 are reservations
+        self.delayed = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    async def acquire(self, name, timeout=None):
+        rate = self.rates.get(name.lower())
+        if rate is None:
+            return
+        burst = self.burst or max(1.0, rate)
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(name, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = (1 - tokens) / rate if tokens < 1 else 0.0
+        if timeout is not None and wait > timeout:
+            self._buckets[name] = (tokens, now)
+            self.rejected[name] += 1
+            raise asyncio.TimeoutError(f"{name} rate limit: next request in {wait:.1f}s")
+        self._buckets[name] = (tokens - 1, now)
+        if wait:
+            self.delayed[name] += 1
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Hand the reservation back for the callers queued behind this one
+                tokens, updated = self._buckets[name]
+                self._buckets[name] = (tokens + 1, updated)
+                raise
+
+    def snapshot(self):
+        now = time.monotonic()
+        snapshot = {}
+        for name, (tokens, updated) in list(self._buckets.items()):
+            rate = self.rates[name.lower()]
+            snapshot[name] = {
+                "rate": rate,
+                "burst": self.burst or max(1.0, rate),
+                "tokens": round(min(self.burst or max(1.0, rate), tokens + (now - updated) * rate), 2),
+                "delayed": self.delayed[name],
+                "rejected": self.rejected[name]
+            }
+        return snapshot
+
+
+class EventLoopThread:
+    """An asyncio loop on a daemon thread, so blocking code can run coroutines on it.
+
+    Every caller shares the one loop, which is what lets a single process
+    keep hundreds of provider requests in flight without a thread each.
+    """
+
+    def __init__(self, name="provider-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+
+                def serve():
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def submit(self, coro):
+        """Schedule coro on the loop; returns a concurrent.futures.Future.
+
+        The caller's context variables (request id, open span) carry over.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and block until it finishes"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("EventLoopThread.run() called from its own loop; await the coroutine instead")
+        return self.submit(coro).result(timeout)
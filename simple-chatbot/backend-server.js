@@ -8,7 +8,7 @@ require('dotenv').config();
 require('./database/db-config');
 
 // Import AI Helper
-const { processMessage, verifyMessage } = require('./utils/aiHelper');
+const { processMessage, verifyMessage, streamMessage, getMetrics } = require('./utils/aiHelper');
 
 // Import routes
 const authRoutes = require('./routes/authRoutes');
@@ -115,6 +115,36 @@ app.post('/api/chat', async (req, res) => {
     }
 });
 
+// Streaming chat endpoint: newline-delimited JSON, one {"delta"} per chunk, then a final {"done": true} record
+app.post('/api/chat/stream', async (req, res) => {
+    const { message, mode } = req.body;
+
+    if (!message) {
+        return res.status(400).json({ error: 'Message is required' });
+    }
+
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.flushHeaders();
+
+    try {
+        console.log(`📩 Received streaming message [${mode || 'chat'}]:`, message);
+        const result = await streamMessage(message, mode || 'chat', (delta) => {
+            res.write(JSON.stringify({ delta }) + '\n');
+        });
+        console.log(`🤖 Streamed response (first token ${result.ttft_ms} ms)`);
+        res.end(JSON.stringify({ done: true, message: result.response, timestamp: new Date().toISOString() }) + '\n');
+    } catch (e) {
+        console.error('❌ Error streaming message:', e);
+        res.end(JSON.stringify({
+            done: true,
+            error: true,
+            message: "I'm experiencing technical difficulties. Please try again later.",
+            timestamp: new Date().toISOString()
+        }) + '\n');
+    }
+});
+
 // Verify endpoint
 app.post('/api/verify', async (req, res) => {
     const { message, image } = req.body;
@@ -147,6 +177,20 @@ app.get('/api/health', (req, res) => {
     res.json({ status: 'Server is running!' });
 });
 
+// Per-stage latency histograms from the Python worker, for Prometheus to scrape
+app.get('/api/metrics', async (req, res) => {
+    try {
+        const metrics = await getMetrics();
+        if (metrics === null) {
+            return res.status(404).send('Metrics are only available with the persistent AI worker\n');
+        }
+        res.type('text/plain; version=0.0.4').send(metrics);
+    } catch (error) {
+        console.error('Metrics Error:', error);
+        res.status(500).send('Error collecting metrics\n');
+    }
+});
+
 app.listen(PORT, () => {
     console.log(`✅ Backend server running on http://localhost:${PORT}`);
     console.log(`📡 API endpoint: http://localhost:${PORT}/api/chat`);
@@ -0,0 +1,146 @@
+"""
+Retrieval benchmark: recall and latency of the legacy keyword scorer,
+BM25 and dense retrieval over the knowledge base.
+
+Usage:
+    python bench_retrieval.py [--k 2] [--scale 20000]
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+from retrieval import BM25Index
+from dense_retrieval import DenseIndex, HashingEmbedder, dense_available, passage_text
+
+KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "knowledge_base.json")
+
+# (query, ids of KB entries that answer it). Mostly paraphrases that do not
+# reuse the entry's own keywords verbatim.
+LABELLED_QUERIES = [
+    ("lost my travel document", {"2"}),
+    ("how do I get a passport to travel abroad", {"2"}),
+    ("number to call for an ambulance", {"1"}),
+    ("who issues national identity cards", {"3"}),
+    ("government farming programme to grow more food", {"4"}),
+    ("is school tuition free for my children", {"5"}),
+    ("how to register my company", {"6"}),
+    ("places to visit on holiday in sierra leone", {"7"}),
+    ("what is the cyber security policy", {"8"}),
+    ("pillars of the cybersecurity policy", {"12"}),
+    ("how is cybersecurity work paid for", {"24"}),
+    ("how can I tell a message is a scam", {"28"}),
+    ("what is fake news", {"29", "56"}),
+    ("someone is bullying me online", {"33", "35", "36", "60", "63", "81"}),
+    ("will orange ask for my pin", {"43", "70"}),
+    ("someone took money from my mobile money account", {"47", "73"}),
+    ("what is sim swap", {"45"}),
+    ("someone sent money to me by mistake and wants it back", {"72"}),
+    ("where do I report an online scam", {"74"}),
+    ("my friend's whatsapp was hacked", {"67"}),
+    ("how do I spot a fake facebook page", {"66", "39"}),
+    ("which law covers cybercrime", {"88"}),
+]
+
+
+def legacy_keyword_search(items, query, top_k):
+    """The original retrieve_context: substring test for every keyword of every entry"""
+    relevant_info = []
+    for item in items:
+        score = 0
+        for keyword in item['keywords']:
+            if keyword in query.lower():
+                score += 1
+        if score > 0:
+            relevant_info.append((score, item))
+    relevant_info.sort(key=lambda x: x[0], reverse=True)
+    return [(info[1], info[0]) for info in relevant_info[:top_k]]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(name, search, queries, k, repeat):
+    hits = 0
+    latencies = []
+    for query, expected in queries:
+        results = search(query, k)
+        if any(item["id"] in expected for item, score in results):
+            hits += 1
+        for _ in range(repeat):
+            start = time.perf_counter()
+            search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "backend": name,
+        "recall_at_k": round(hits / len(queries), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 4),
+        "p95_ms": round(percentile(latencies, 95), 4)
+    }
+
+
+def synthetic_kb(items, size, seed=13):
+    """Grow the KB to `size` passages by shuffling words of existing entries"""
+    rng = random.Random(seed)
+    grown = list(items)
+    while len(grown) < size:
+        source = rng.choice(items)
+        words = source["content"].split()
+        rng.shuffle(words)
+        grown.append({
+            "id": f"synthetic-{len(grown)}",
+            "topic": source["topic"],
+            "content": " ".join(words),
+            "keywords": rng.sample(source["keywords"], min(3, len(source["keywords"])))
+        })
+    return grown
+
+
+def build_backends(items):
+    backends = [
+        ("legacy_keyword", lambda q, k: legacy_keyword_search(items, q, k)),
+        ("bm25", BM25Index(items).search)
+    ]
+    if dense_available():
+        texts = [passage_text(item) for item in items]
+        embedder = HashingEmbedder().fit(texts)
+        backends.append(("dense", DenseIndex(items, embedder.embed_many(texts), embedder).search))
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kb", default=KB_PATH)
+    parser.add_argument("--k", type=int, default=2, help="Top-k passages per query")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per query")
+    parser.add_argument("--scale", type=int, default=0, help="Also time a synthetic KB of this many passages")
+    args = parser.parse_args()
+
+    with open(args.kb, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    report = {"k": args.k, "entries": len(items), "results": []}
+    for name, search in build_backends(items):
+        report["results"].append(run(name, search, LABELLED_QUERIES, args.k, args.repeat))
+
+    if args.scale:
+        grown = synthetic_kb(items, args.scale)
+        report["scaled"] = {"entries": len(grown), "results": []}
+        for name, search in build_backends(grown):
+            # Recall is not meaningful once synthetic passages compete; latency is
+            result = run(name, search, LABELLED_QUERIES, args.k, max(1, args.repeat // 4))
+            del result["recall_at_k"]
+            report["scaled"]["results"].append(result)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Service benchmark: throughput, latency percentiles and peak memory of the Truth Engine
+Replays the ChatFAQ questions and synthetic scam claims against local stub providers
+
+Usage:
+    python bench_service.py [--latency-ms 200] [--error-rate 0.05] [--output bench.json]
+    python bench_service.py --provider openrouter=800:0.2 --baseline bench.json
+
+Each provider gets its own stub server, so one can be made slow or flaky
+(--provider NAME=LATENCY_MS[:ERROR_RATE]) while the others stay healthy.
+Results are JSON; --baseline adds the change against an earlier run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Unix only; on Windows the report just has no peak RSS
+    resource = None
+
+from stub_llm_server import StubConfig, StubLLMServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(BASE_DIR, "..", "scripts")
+PROVIDERS = ("openrouter", "openai", "gemini")
+WORKLOADS = ("chat", "verify", "verify_claim", "burst")
+
+# Building blocks for synthetic WhatsApp-style claims: scams, rumours and genuine notices
+CLAIM_TEMPLATES = [
+    "URGENT!! Government giving money to all {group}. Register to receive Le{amount} before {day}: {link}",
+    "{network} is giving free {bundle} data to celebrate {event}, click this link to claim {link}",
+    "Your {network} money account suspended. Send your PIN to {phone} to verify your account",
+    "The President has announced that {group} will get Le{amount} every month from {day}",
+    "Ministry of Health confirms new ebola cases in {town}, schools closed until {day}",
+    "{network} promo: you are the winner of Le{amount}! Call {phone} to collect your prize",
+    "NASSIT is paying Le{amount} bonus to {group}, share this message with 10 people to qualify",
+    "Passport office in {town} now issues passports in {amount} days, apply at the official portal",
+    "Free scholarship for {group} from the United Nations, pay Le{amount} registration fee to {phone}",
+    "Is it true that {network} will shut down mobile money in {town} on {day}?"
+]
+CLAIM_FILLS = {
+    "group": ["students", "market women", "okada riders", "teachers", "pensioners", "farmers"],
+    "amount": ["500,000", "1,000,000", "250,000", "50", "2,500,000", "7"],
+    "day": ["Friday", "tomorrow", "end of month", "Independence Day", "Monday"],
+    "link": ["http://gov-sl-grant.xyz", "bit.ly/salone-cash", "http://orange-promo.top/claim"],
+    "network": ["Orange", "Africell", "Qcell"],
+    "bundle": ["10GB", "unlimited", "5GB"],
+    "event": ["Independence Day", "Christmas", "its anniversary"],
+    "phone": ["076 123 456", "+232 88 555 010", "030 999 111"],
+    "town": ["Freetown", "Bo", "Kenema", "Makeni", "Koidu"]
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def faq_questions(path):
+    from update_kb import parse_faq
+    return [pair["q"] for pair in parse_faq(path) if pair["q"]]
+
+
+def synthetic_claims(count, seed=11):
+    """Reproducible mix of claims; about a third are light rewordings of an earlier one"""
+    rng = random.Random(seed)
+    claims = []
+    while len(claims) < count:
+        if claims and rng.random() < 0.3:
+            words = rng.choice(claims).split()
+            words[rng.randrange(len(words))] = rng.choice(["pls", "now", "!!", "share", "🙏"])
+            claims.append(" ".join(words))
+            continue
+        template = rng.choice(CLAIM_TEMPLATES)
+        claims.append(template.format(**{key: rng.choice(values) for key, values in CLAIM_FILLS.items()}))
+    return claims
+
+
+def parse_provider(spec):
+    """NAME=LATENCY_MS[:ERROR_RATE] -> (name, latency_ms, error_rate or None)"""
+    name, _, value = spec.partition("=")
+    if name not in PROVIDERS or not value:
+        raise argparse.ArgumentTypeError(f"expected NAME=LATENCY_MS[:ERROR_RATE] with NAME one of {', '.join(PROVIDERS)}")
+    latency, _, error_rate = value.partition(":")
+    return name, float(latency), float(error_rate) if error_rate else None
+
+
+def start_stubs(args):
+    overrides = {name: (latency, error_rate) for name, latency, error_rate in args.provider}
+    stubs = {}
+    for index, name in enumerate(PROVIDERS):
+        latency, error_rate = overrides.get(name, (args.latency_ms, None))
+        config = StubConfig(
+            latency_ms=latency,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate if error_rate is None else error_rate,
+            error_status=args.error_status,
+            seed=args.seed + index
+        )
+        stubs[name] = StubLLMServer(config=config).start()
+    return stubs
+
+
+def configure_environment(stubs, args):
+    """Point ai_service at the stubs; must run before it is imported (its settings are read at import)"""
+    os.environ.update({
+        "OPENROUTER_BASE_URL": stubs["openrouter"].url,
+        "OPENAI_BASE_URL": stubs["openai"].url,
+        "GEMINI_BASE_URL": stubs["gemini"].url,
+        "DeepSeek_API_KEY": "bench-deepseek",
+        "OPENAI_API_KEY": "sk-bench",
+        "GEMINI_API_KEY": "AIza-bench",
+        "SPAN_LOG": "off",
+        # Nothing the benchmark learns should be persisted or picked up from a previous run
+        "RESPONSE_CACHE_DB": "",
+        "NEAR_DUPLICATE_FILE": "",
+        "PROVIDER_HEALTH_FILE": ""
+    })
+    if not args.cache:
+        os.environ["RESPONSE_CACHE"] = "off"
+        os.environ["NEAR_DUPLICATES"] = "off"
+
+
+def build_workloads(args):
+    import ai_service
+    sys.path.insert(0, SCRIPTS_DIR)
+    from verification_service import VerificationService
+
+    verdict_index = None
+    if args.cache:
+        from near_duplicates import NearDuplicateIndex
+        verdict_index = NearDuplicateIndex()
+    service = VerificationService(verdict_index=verdict_index)
+
+    questions = faq_questions(args.faq)
+    claims = synthetic_claims(args.claims, args.seed)
+    # name -> (inputs, function, concurrency)
+    return {
+        "chat": (questions, lambda q: ai_service.get_response(q, mode="chat"), args.concurrency),
+        "verify": (claims, ai_service.verify_information, args.concurrency),
+        "verify_claim": (claims, lambda c: service.verify_claim({"type": "text", "text": c}), args.concurrency),
+        # An alert going out: everyone asks the same question at once
+        "burst": ([questions[0]] * args.burst, lambda q: ai_service.get_response(q, mode="chat"), args.burst)
+    }
+
+
+def run(name, fn, inputs, concurrency, args, stubs):
+    """Replay inputs through fn from `concurrency` threads; returns the workload's results"""
+    from metrics import REGISTRY
+
+    if name != "burst":
+        inputs = [inputs[i % len(inputs)] for i in range(args.requests or len(inputs))]
+    before = {provider: dict(stub.stats) for provider, stub in stubs.items()}
+    REGISTRY.reset()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, inputs))
+    wall = time.perf_counter() - wall_start
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = {
+        "workload": name,
+        "concurrency": concurrency,
+        "requests": len(inputs),
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(inputs) / wall, 2) if wall else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        **{f"p{pct}_ms": round(percentile(latencies, pct), 2) for pct in (50, 95, 99)},
+        "max_ms": round(max(latencies), 2) if latencies else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "upstream": {
+            provider: {key: stub.stats[key] - before[provider][key] for key in stub.stats}
+            for provider, stub in stubs.items()
+        },
+        "stages": REGISTRY.snapshot()
+    }
+    if traced_peak is not None:
+        result["traced_peak_mb"] = round(traced_peak / (1024 * 1024), 2)
+    return result
+
+
+def peak_rss_mb():
+    """High-water resident memory of this process so far, or None without the resource module"""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compare(report, baseline):
+    """Relative change (%) of the headline numbers against a previous report"""
+    previous = {r["workload"]: r for r in baseline.get("results", [])}
+    changes = {}
+    for result in report["results"]:
+        old = previous.get(result["workload"])
+        if not old:
+            continue
+        changes[result["workload"]] = {
+            key: round((result[key] - old[key]) / old[key] * 100, 1)
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+            if result.get(key) is not None and old.get(key)
+        }
+    return changes
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Comma-separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument("--faq", default=os.path.join(BASE_DIR, "..", "ChatFAQ", "chatFAQ"))
+    parser.add_argument("--claims", type=int, default=200, help="Synthetic claims to generate")
+    parser.add_argument("--requests", type=int, default=0, help="Requests per workload (default: one per input)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=50, help="Simultaneous identical questions in the burst workload")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Stub provider latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--provider", type=parse_provider, action="append", default=[],
+                        help="Per-provider override, NAME=LATENCY_MS[:ERROR_RATE]")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache and near-duplicate index on")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations (slows the run)")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the service's stderr logging")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(names) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(sorted(unknown))}")
+
+    stubs = start_stubs(args)
+    configure_environment(stubs, args)
+    stderr = sys.stderr
+    try:
+        workloads = build_workloads(args)
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")},
+            "results": []
+        }
+        for name in names:
+            inputs, fn, concurrency = workloads[name]
+            if not args.verbose:
+                sys.stderr = open(os.devnull, "w")
+            try:
+                report["results"].append(run(name, fn, inputs, concurrency, args, stubs))
+            finally:
+                if sys.stderr is not stderr:
+                    sys.stderr.close()
+                    sys.stderr = stderr
+            result = report["results"][-1]
+            stderr.write(f"⏱️ {name}: {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms\n")
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["baseline"] = {"path": args.baseline, "changes_pct": compare(report, json.load(f))}
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Token-budgeted context assembly for the Truth Engine
+Fits retrieved KB passages into a provider's prompt budget: best passages first, trimmed to their
+most relevant sentences, with text already included elsewhere dropped
+"""
+
+import re
+import threading
+
+from retrieval import tokenize
+
+# Word runs and single punctuation marks; long words count extra, as BPE splits them
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+# A sentence whose word trigrams are mostly already in the context adds nothing
+DUPLICATE_OVERLAP = 0.8
+# A passage gets a cut-down sentence only if at least this many tokens are left for it
+MIN_FRAGMENT_TOKENS = 24
+
+
+def estimate_tokens(text):
+    """Rough BPE token count without a tokenizer: one per word or symbol, more for long words.
+
+    Leans towards overcounting, so a budget is not exceeded in practice.
+    """
+    return sum(1 + len(piece) // 8 for piece in _PIECE_RE.findall(text))
+
+
+def _shingles(sentence):
+    words = re.findall(r"\w+", sentence.lower())
+    if len(words) < 3:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _truncate(sentence, budget):
+    """The longest word prefix of sentence that fits budget tokens"""
+    words = sentence.split()
+    kept = []
+    used = 0
+    for word in words:
+        cost = estimate_tokens(word)
+        if used + cost + 1 > budget:  # +1 for the ellipsis
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + " …" if kept else ""
+
+
+def assemble(query, passages, budget):
+    """Fit passages (best first) into budget estimated tokens; returns (passages, report).
+
+    Passages are taken in relevance order. Sentences that repeat text
+    already taken are dropped; a passage that does not fit whole keeps its
+    sentences sharing most terms with the query, in their original order.
+    budget <= 0 means unbounded (duplicates are still dropped).
+    """
+    query_terms = set(tokenize(query))
+    seen = set()
+    chosen = []
+    used = 0
+    report = {"passages_in": len(passages), "passages_out": 0, "duplicates_dropped": 0, "trimmed": 0}
+    tokens_in = 0
+
+    for passage in passages:
+        sentences = []
+        for sentence in _SENTENCE_RE.split(passage.strip()):
+            if not sentence:
+                continue
+            cost = estimate_tokens(sentence)
+            tokens_in += cost
+            shingles = _shingles(sentence)
+            if shingles and len(shingles & seen) >= DUPLICATE_OVERLAP * len(shingles):
+                report["duplicates_dropped"] += 1
+                continue
+            sentences.append((sentence, cost, shingles))
+
+        left = budget - used if budget > 0 else None
+        if not sentences or (left is not None and left <= 0):
+            continue
+        total = sum(cost for _, cost, _ in sentences)
+        if left is None or total <= left:
+            keep = sentences
+        else:
+            report["trimmed"] += 1
+            ranked = sorted(range(len(sentences)),
+                            key=lambda i: (-len(query_terms.intersection(tokenize(sentences[i][0]))), i))
+            picked = []
+            room = left
+            for i in ranked:
+                if sentences[i][1] <= room:
+                    picked.append(i)
+                    room -= sentences[i][1]
+            if not picked and left >= MIN_FRAGMENT_TOKENS:
+                fragment = _truncate(sentences[ranked[0]][0], left)
+                if fragment:
+                    sentences[ranked[0]] = (fragment, estimate_tokens(fragment), sentences[ranked[0]][2])
+                    picked.append(ranked[0])
+            keep = [sentences[i] for i in sorted(picked)]
+        if not keep:
+            continue
+        chosen.append(" ".join(sentence for sentence, _, _ in keep))
+        used += sum(cost for _, cost, _ in keep)
+        for _, _, shingles in keep:
+            seen.update(shingles)
+
+    report.update(passages_out=len(chosen), tokens_in=tokens_in, tokens_out=used, tokens_saved=tokens_in - used)
+    return chosen, report
+
+
+class ContextStats:
+    """Running totals of context tokens retrieved vs. sent, for stats and Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {"assemblies": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0, "trimmed": 0, "duplicates_dropped": 0}
+
+    def add(self, report):
+        with self._lock:
+            self.totals["assemblies"] += 1
+            for key in ("tokens_in", "tokens_out", "tokens_saved", "trimmed", "duplicates_dropped"):
+                self.totals[key] += report[key]
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self.totals)
+        totals["saved_ratio"] = round(totals["tokens_saved"] / totals["tokens_in"], 3) if totals["tokens_in"] else None
+        return totals
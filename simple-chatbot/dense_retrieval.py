@@ -0,0 +1,193 @@
+"""
+Dense-similarity retrieval for the Truth Engine
+Hashing-trick TF-IDF embeddings stored as a memory-mapped float32 matrix
+
+Build (or rebuild) the matrix next to the knowledge base with:
+    python dense_retrieval.py
+"""
+
+import json
+import math
+import os
+import sys
+import zlib
+
+from retrieval import FIELD_WEIGHTS, file_sha256, tokenize
+
+try:
+    import numpy as np
+except ImportError:  # dense retrieval is optional; BM25 works without NumPy
+    np = None
+
+DENSE_DIM = 1024
+# Character trigrams let "cyber" match "cybersecurity" and survive typos,
+# but they are noisier than whole words so they count for less.
+NGRAM_WEIGHT = 0.5
+MIN_SIMILARITY = 0.1
+
+
+def dense_available():
+    return np is not None
+
+
+def dense_paths(kb_path):
+    """Matrix and metadata file paths stored next to the knowledge base"""
+    base = os.path.splitext(kb_path)[0]
+    return base + ".dense.npy", base + ".dense.json"
+
+
+def passage_text(item):
+    """Flatten a KB entry into one string, repeating fields by their weight"""
+    parts = []
+    for field, weight in FIELD_WEIGHTS.items():
+        value = item.get(field) or ""
+        if isinstance(value, list):
+            value = " ".join(value)
+        parts.extend([value] * weight)
+    return " ".join(parts)
+
+
+class HashingEmbedder:
+    """Projects text into a fixed number of buckets with signed feature hashing"""
+
+    def __init__(self, dim=DENSE_DIM, idf=None):
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    def _features(self, text):
+        for token in tokenize(text):
+            yield token, 1.0
+            padded = f"<{token}>"
+            for i in range(len(padded) - 2):
+                yield "#" + padded[i:i + 3], NGRAM_WEIGHT
+
+    def bucket_counts(self, text):
+        """{bucket: signed term frequency} for a piece of text"""
+        counts = {}
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket = h % self.dim
+            sign = 1.0 if h & 0x80000000 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign * weight
+        return counts
+
+    def fit(self, texts):
+        """Learn per-bucket IDF weights from the passages"""
+        df = np.zeros(self.dim, dtype=np.float64)
+        for text in texts:
+            for bucket in self.bucket_counts(text):
+                df[bucket] += 1
+        n = len(texts)
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for bucket, value in self.bucket_counts(text).items():
+            # Sublinear TF keeps a passage from being dominated by one repeated word
+            tf = math.copysign(1 + math.log(abs(value)), value) if abs(value) >= 1 else value
+            vector[bucket] = tf * self.idf[bucket]
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+def build_dense_index(kb_path, items=None, dim=DENSE_DIM):
+    """Embed every KB passage and save the matrix + metadata next to the KB"""
+    if items is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+
+    texts = [passage_text(item) for item in items]
+    embedder = HashingEmbedder(dim).fit(texts)
+    matrix = embedder.embed_many(texts)
+
+    matrix_path, meta_path = dense_paths(kb_path)
+    meta = {
+        "dim": dim,
+        "entries": len(items),
+        "kb_sha256": file_sha256(kb_path),
+        "idf": [round(float(x), 6) for x in embedder.idf]
+    }
+    # Write to temp files and rename so workers never map a half-written matrix
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, matrix)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(matrix_path + ".tmp", matrix_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return matrix_path
+
+
+class DenseIndex:
+    """Cosine similarity search over a (memory-mapped) passage matrix"""
+
+    def __init__(self, items, matrix, embedder, min_similarity=MIN_SIMILARITY):
+        self.items = items
+        self.matrix = matrix
+        self.embedder = embedder
+        self.min_similarity = min_similarity
+
+    @classmethod
+    def load(cls, items, kb_path, **kwargs):
+        """Map the prebuilt matrix, rebuilding it first if it is missing or stale"""
+        matrix_path, meta_path = dense_paths(kb_path)
+        meta = None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        if not meta or meta.get("kb_sha256") != file_sha256(kb_path) or meta.get("entries") != len(items):
+            sys.stderr.write("🧮 Building dense retrieval matrix...\n")
+            build_dense_index(kb_path, items)
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        # mmap_mode shares the pages between every worker process on the host
+        matrix = np.load(matrix_path, mmap_mode="r")
+        embedder = HashingEmbedder(meta["dim"], np.asarray(meta["idf"], dtype=np.float32))
+        return cls(items, matrix, embedder, **kwargs)
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query, top_k=2):
+        """Return up to top_k (item, cosine similarity) pairs, best first"""
+        query_vector = self.embedder.embed(query)
+        if not query_vector.any() or not len(self.items):
+            return []
+
+        scores = self.matrix @ query_vector
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            candidates = np.argpartition(scores, -k)[-k:]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            (self.items[i], float(scores[i]))
+            for i in candidates
+            if scores[i] >= self.min_similarity
+        ]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the dense retrieval matrix for the knowledge base")
+    parser.add_argument("--kb", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "knowledge_base.json"))
+    parser.add_argument("--dim", type=int, default=DENSE_DIM)
+    args = parser.parse_args()
+
+    if not dense_available():
+        sys.exit("NumPy is required for dense retrieval (pip install numpy)")
+    path = build_dense_index(args.kb, dim=args.dim)
+    print(f"Wrote dense matrix to {path}")
@@ -0,0 +1,263 @@
+"""
+Compiled knowledge base snapshot for the Truth Engine
+One binary file holding the KB entries and a prebuilt BM25 index, memory-mapped and decoded on access
+
+Layout (little-endian):
+    header        MAGIC, format version, source mtime/size/sha256, counts, section offsets
+    entry table   n + 1 uint64 offsets into the entry blob
+    entry blob    each entry as compact UTF-8 JSON, stored back to back
+    term table    t + 1 uint64 offsets into the term blob (terms sorted by their UTF-8 bytes)
+    term blob     the terms, back to back
+    posting table t + 1 uint64 offsets into the posting array (in postings, not bytes)
+    postings      (doc id uint32, BM25 impact float64) per term and document
+
+Each version of the knowledge base gets its own snapshot file next to it
+(knowledge_base.<sha256 prefix>.kbsnap), so a rebuild never overwrites a file
+that a running worker has mapped. Build (or rebuild) the snapshot with:
+    python kb_snapshot.py
+"""
+
+import glob
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict
+
+from retrieval import BM25Index, file_sha256, tokenize
+
+MAGIC = b"GOVKBSNP"
+FORMAT_VERSION = 1
+# magic, version, mtime_ns, size, sha256, entries, terms, then six section offsets
+HEADER = struct.Struct("<8sIqQ32sII6Q")
+OFFSET = struct.Struct("<Q")
+POSTING = struct.Struct("<Id")
+
+
+def snapshot_path(kb_path, sha):
+    """Snapshot file for the KB version with content hash sha, stored next to the knowledge base"""
+    return f"{os.path.splitext(kb_path)[0]}.{sha[:16]}.kbsnap"
+
+
+def snapshot_paths(kb_path):
+    """Snapshot files of any version of kb_path, newest first"""
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+    paths = glob.glob(glob.escape(os.path.splitext(kb_path)[0]) + ".*.kbsnap")
+    return sorted(paths, key=mtime, reverse=True)
+
+
+def remove_stale_snapshots(kb_path, keep):
+    """Delete the snapshots of other KB versions (and the unversioned file older builds wrote).
+
+    One that a worker still has mapped cannot be deleted on Windows; it is
+    left for a later call.
+    """
+    keep = os.path.abspath(keep)
+    for path in snapshot_paths(kb_path) + [os.path.splitext(kb_path)[0] + ".kbsnap"]:
+        if os.path.abspath(path) == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # already gone, or still mapped
+
+
+def build_snapshot(kb_path, path=None, items=None, k1=1.5, b=0.75):
+    """Compile the KB (and its BM25 index) into a snapshot file; returns the path.
+
+    BM25 is fully evaluated per (term, document) at build time, so a query
+    only has to add up the stored impacts of its terms.
+    """
+    st = os.stat(kb_path)
+    sha = file_sha256(kb_path)
+    path = path or snapshot_path(kb_path, sha)
+    if items is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+
+    index = BM25Index(items, k1=k1, b=b)
+    terms = sorted(index.postings, key=lambda term: term.encode("utf-8"))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)  # filled in once the section offsets are known
+        sections = []
+
+        blobs = [json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for item in items]
+        sections.append(f.tell())
+        _write_offsets(f, blobs)
+        sections.append(f.tell())
+        for blob in blobs:
+            f.write(blob)
+        del blobs
+
+        encoded_terms = [term.encode("utf-8") for term in terms]
+        sections.append(f.tell())
+        _write_offsets(f, encoded_terms)
+        sections.append(f.tell())
+        for term in encoded_terms:
+            f.write(term)
+
+        sections.append(f.tell())
+        position = 0
+        f.write(OFFSET.pack(0))
+        for term in terms:
+            position += len(index.postings[term])
+            f.write(OFFSET.pack(position))
+        sections.append(f.tell())
+        for term in terms:
+            idf = index.idf[term]
+            for doc_id, tf in index.postings[term]:
+                impact = idf * tf * (k1 + 1) / (tf + index.length_norms[doc_id])
+                f.write(POSTING.pack(doc_id, impact))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, st.st_mtime_ns, st.st_size, bytes.fromhex(sha),
+                            len(items), len(terms), *sections))
+    # Rename into place so workers never map a half-written snapshot
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Windows: another process built the same version first and has it mapped
+        os.remove(tmp_path)
+        if not os.path.exists(path):
+            raise
+    return path
+
+
+def _write_offsets(f, blobs):
+    position = 0
+    f.write(OFFSET.pack(0))
+    for blob in blobs:
+        position += len(blob)
+        f.write(OFFSET.pack(position))
+
+
+class KBSnapshot:
+    """Read-only view of a snapshot: a lazy sequence of KB entries that can also be searched.
+
+    Only the header is read on open; entries are decoded when accessed and
+    postings when a query term needs them, so startup cost and resident
+    memory do not grow with the KB.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"{path} is not a KB snapshot")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.source_mtime_ns, self.source_size, sha, self.entries, self.terms,
+         self._entry_table, self._entry_blob, self._term_table, self._term_blob,
+         self._posting_table, self._postings) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} KB snapshot")
+        self.source_sha256 = sha.hex()
+
+    @classmethod
+    def load(cls, kb_path):
+        """Open the snapshot of kb_path as it is now, building it first if there is none.
+
+        Snapshots of older versions are removed once the current one is open.
+        """
+        snapshot = None
+        for path in snapshot_paths(kb_path):
+            try:
+                candidate = cls(path)
+            except (OSError, ValueError):
+                continue
+            if candidate.is_current(kb_path):
+                snapshot = candidate
+                break
+            candidate.close()
+        if snapshot is None:
+            sys.stderr.write("📦 Building knowledge base snapshot...\n")
+            snapshot = cls(build_snapshot(kb_path))
+        remove_stale_snapshots(kb_path, keep=snapshot.path)
+        return snapshot
+
+    def is_current(self, kb_path):
+        """True if the snapshot was compiled from the KB file as it is now"""
+        st = os.stat(kb_path)
+        if (st.st_mtime_ns, st.st_size) == (self.source_mtime_ns, self.source_size):
+            return True
+        # Touched or copied but not edited: same content, still current
+        return st.st_size == self.source_size and file_sha256(kb_path) == self.source_sha256
+
+    def close(self):
+        self._mm.close()
+
+    def _offset(self, table, index):
+        return OFFSET.unpack_from(self._mm, table + index * OFFSET.size)[0]
+
+    def __len__(self):
+        return self.entries
+
+    def __getitem__(self, doc_id):
+        if doc_id < 0:
+            doc_id += self.entries
+        if not 0 <= doc_id < self.entries:
+            raise IndexError("KB entry index out of range")
+        start = self._entry_blob + self._offset(self._entry_table, doc_id)
+        end = self._entry_blob + self._offset(self._entry_table, doc_id + 1)
+        return json.loads(self._mm[start:end].decode("utf-8"))
+
+    def __iter__(self):
+        for doc_id in range(self.entries):
+            yield self[doc_id]
+
+    def _term_id(self, term):
+        """Binary search of the sorted term table"""
+        target = term.encode("utf-8")
+        lo, hi = 0, self.terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._offset(self._term_table, mid)
+            end = self._offset(self._term_table, mid + 1)
+            probe = self._mm[self._term_blob + start:self._term_blob + end]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def score(self, query):
+        """Return {doc_id: BM25 score} for every passage sharing a term with the query"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            start = self._postings + self._offset(self._posting_table, term_id) * POSTING.size
+            end = self._postings + self._offset(self._posting_table, term_id + 1) * POSTING.size
+            for doc_id, impact in POSTING.iter_unpack(self._mm[start:end]):
+                scores[doc_id] += impact
+        return scores
+
+    def search(self, query, top_k=2):
+        """Return up to top_k (item, score) pairs, best first"""
+        scores = self.score(query)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda hit: hit[1])
+        return [(self[doc_id], score) for doc_id, score in best]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compile knowledge_base.json into a memory-mappable snapshot")
+    parser.add_argument("--kb", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "knowledge_base.json"))
+    args = parser.parse_args()
+    path = build_snapshot(args.kb)
+    snapshot = KBSnapshot(path)
+    print(f"Wrote {path} ({len(snapshot)} entries, {snapshot.terms} terms, {os.path.getsize(path)} bytes)")
+    snapshot.close()
+    remove_stale_snapshots(args.kb, keep=path)
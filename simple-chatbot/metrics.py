@@ -0,0 +1,196 @@
+"""
+Latency spans and histograms for the Truth Engine
+Each stage is timed as a span, logged as one JSON line on stderr and aggregated for Prometheus
+
+    with span("retrieve", backend="bm25"):
+        ...
+    annotate(status=503)   # adds to the innermost open span
+
+The request id and open span live in contextvars, so asyncio tasks (the
+provider calls) inherit them; work handed to another thread keeps them by
+running under contextvars.copy_context(), as the admission scheduler does.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Span attributes that become histogram labels; everything else is only logged
+LABEL_KEYS = ("provider", "status", "mode", "action", "outcome")
+# SPAN_LOG=off keeps aggregating but stops the per-span stderr lines
+SPAN_LOG = os.environ.get("SPAN_LOG", "on") != "off"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram for one (stage, labels) series"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """Estimate from the buckets, interpolating linearly inside the bucket
+        and clamped to the smallest/largest value actually observed"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        estimate = self.max
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                fraction = (rank - seen) / self.counts[i] if self.counts[i] else 0.0
+                estimate = lower + (bound - lower) * fraction
+                break
+            seen += self.counts[i]
+            lower = bound
+        return min(max(estimate, self.min), self.max)
+
+
+class MetricsRegistry:
+    """Histograms keyed by stage and label values; safe to use from many threads"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._series = {}  # (stage, ((label, value), ...)) -> Histogram
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, labels=None):
+        key = (stage, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """{series name: count, mean and p50/p95/p99 in ms}"""
+        summary = {}
+        with self._lock:
+            for (stage, labels), h in sorted(self._series.items()):
+                name = stage + "".join(f"[{k}={v}]" for k, v in labels)
+                summary[name] = {
+                    "count": h.count,
+                    "mean_ms": round(h.sum / h.count * 1000, 2) if h.count else None,
+                    **{f"p{int(q * 100)}_ms": round(h.quantile(q) * 1000, 2) for q in (0.5, 0.95, 0.99)}
+                }
+        return summary
+
+    def prometheus_text(self, prefix="govchat", extra=None):
+        """Prometheus text exposition format (version 0.0.4).
+
+        extra maps metric name -> (help, value) for service-level values;
+        names ending in _total are exported as counters, the rest as gauges.
+        A value may also be a {label value: value} dict, given as
+        (help, values, label name), to export one series per label value.
+        """
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of request handling",
+            f"# TYPE {name} histogram"
+        ]
+        with self._lock:
+            for (stage, labels), h in sorted(self._series.items()):
+                base = [("stage", stage), *labels]
+                cumulative = 0
+                for bound, count in zip((*h.buckets, "+Inf"), h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(base + [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(base)} {h.sum:.6f}")
+                lines.append(f"{name}_count{_labels(base)} {h.count}")
+        for metric, (help_text, value, *label) in sorted((extra or {}).items()):
+            if value is None:
+                continue
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {'counter' if metric.endswith('_total') else 'gauge'}")
+            if isinstance(value, dict):
+                for label_value, series_value in sorted(value.items()):
+                    lines.append(f"{prefix}_{metric}{_labels([(label[0] if label else 'label', label_value)])} {series_value}")
+            else:
+                lines.append(f"{prefix}_{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Time a block; yields the attribute dict so the block can add to it"""
+    attrs = dict(attrs)
+    token = _current_span.set(attrs)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("outcome", "error")
+        attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        record(stage, time.perf_counter() - start, **attrs)
+
+
+def record(stage, seconds, **attrs):
+    """Record an already-measured span (for stages that cannot be a with-block, e.g. across yields)"""
+    REGISTRY.observe(stage, seconds, {k: attrs[k] for k in LABEL_KEYS if attrs.get(k) is not None})
+    if SPAN_LOG:
+        line = {"span": stage, "ms": round(seconds * 1000, 3), "ts": round(time.time(), 3)}
+        request_id = _request_id.get()
+        if request_id is not None:
+            line["request_id"] = request_id
+        line.update((k, v) for k, v in attrs.items() if v is not None)
+        sys.stderr.write(json.dumps(line, default=str) + "\n")
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of this thread/context, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.update(attrs)
+
+
+@contextmanager
+def request_context(request_id):
+    """Tag every span opened inside the block with request_id"""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
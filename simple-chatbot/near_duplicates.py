@@ -0,0 +1,289 @@
+"""
+Near-duplicate claim index for the Truth Engine
+MinHash signatures with LSH banding over previously verified claims, so
+lightly edited copies of a viral message reuse the earlier verdict
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Money amounts ("Le 500,000", "$50", "2 million leones") vary between copies of the same scam
+_AMOUNT_RE = re.compile(r"(?:\b(?:nle|le|sll|usd)\s?|\$\s?)\d[\d,.]*(?:\s?(?:million|m|k)\b)?"
+                        r"|\d[\d,.]*\s?(?:million\s)?(?:leones?|dollars?|usd|sll)\b")
+# Any other number (phone numbers, dates, counts) is part of the claim
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD_RE = re.compile(r"[a-z#]+|\d+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Lock file handling for a log shared by several processes
+LOCK_TIMEOUT = 2.0
+STALE_LOCK_SECONDS = 30
+# A near-identical claim with one of these added or removed can mean the opposite
+NEGATIONS = frozenset({"not", "no", "never", "nor", "fake", "false", "hoax", "untrue", "isnt", "arent", "doesnt", "dont", "didnt", "wont", "cannot", "cant"})
+
+
+def claim_shingles(text):
+    """Word bigrams of the normalized claim.
+
+    Money amounts are collapsed to "#" and punctuation/emoji dropped, so
+    "Le500,000!!" and "Le 1,000,000 🙏" shingle the same way. Other
+    numbers stay in as words (see claim_numbers).
+    """
+    words = _WORD_RE.findall(_claim_numbers_text(text))
+    if len(words) < 2:
+        return set(words)
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _claim_numbers_text(text):
+    text = _AMOUNT_RE.sub(" # ", text.lower())
+    return _NUMBER_RE.sub(lambda m: " " + m.group().replace(",", "").replace(".", "") + " ", text)
+
+
+def claim_numbers(text):
+    """Numbers in the claim other than money amounts, which must match for two claims to count as duplicates.
+
+    "The emergency number is 019" and "... is 999" differ in one word but
+    are different claims.
+    """
+    return sorted(re.findall(r"\d+", _claim_numbers_text(text)))
+
+
+def claim_negations(text):
+    """Negation words in the claim, which must match for two claims to count as duplicates"""
+    return sorted(NEGATIONS.intersection(_WORD_RE.findall(text.lower().replace("'", "").replace("’", ""))))
+
+
+class NearDuplicateIndex:
+    """Bounded, expiring MinHash-LSH index of verified claims.
+
+    `bands` x `rows` must equal `num_perm`; with 16 bands of 4 rows, pairs
+    above ~0.5 Jaccard usually share a bucket, and `threshold` then filters
+    candidates on the estimated similarity. Claims whose negation words
+    or numbers (other than money amounts) differ never match, however
+    similar. With `path` set, entries are appended to a JSONL log that is
+    replayed on load; several processes may share the log, and appends and
+    compaction take a lock file next to it.
+    """
+
+    def __init__(self, threshold=0.7, num_perm=64, bands=16, max_entries=5000, ttl=7 * 24 * 3600, path=None, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._entries = OrderedDict()  # entry id -> entry dict, oldest first
+        self._buckets = {}  # (band, band hash) -> set of entry ids
+        self._lock = threading.Lock()
+        self._log_lines = 0
+        self.stats = {"lookups": 0, "hits": 0, "added": 0, "evicted": 0, "expired": 0}
+        if path:
+            self._load()
+
+    def signature(self, text):
+        shingles = claim_shingles(text)
+        if not shingles:
+            return None
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ]
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (band, hash(tuple(signature[start:start + self.rows])))
+
+    def _similarity(self, a, b):
+        return sum(1 for x, y in zip(a, b) if x == y) / self.num_perm
+
+    def lookup(self, text):
+        """Best verified claim within the threshold, as {"verdict", "similarity", "original"}; else None"""
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        negations = claim_negations(text)
+        numbers = claim_numbers(text)
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._expire(now)
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            best, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                if entry.get("negations", []) != negations or entry.get("numbers", []) != numbers:
+                    continue
+                score = self._similarity(signature, entry["signature"])
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                return None
+            self.stats["hits"] += 1
+            return {
+                "verdict": best["verdict"],
+                "similarity": round(best_score, 3),
+                "original": {
+                    "id": best["id"],
+                    "claim": best["claim"],
+                    "verified_at": best["verified_at"]
+                }
+            }
+
+    def add(self, text, verdict):
+        """Remember a verdict; returns the new entry id (None for text with no words)"""
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        with self._lock:
+            entry = {
+                # Unique across processes: every worker appends to the same log
+                "id": f"claim-{uuid.uuid4().hex}",
+                "claim": text,
+                "verdict": verdict,
+                "signature": signature,
+                "negations": claim_negations(text),
+                "numbers": claim_numbers(text),
+                "verified_at": time.time()
+            }
+            self._insert(entry)
+            self.stats["added"] += 1
+            self._append_log(entry)
+            return entry["id"]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), threshold=self.threshold)
+
+    def _insert(self, entry):
+        if entry["id"] in self._entries:
+            # A later record for the same id (logs written before ids were unique); drop the old bands
+            self._remove(entry["id"])
+        self._entries[entry["id"]] = entry
+        for key in self._band_keys(entry["signature"]):
+            self._buckets.setdefault(key, set()).add(entry["id"])
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evicted"] += 1
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for key in self._band_keys(entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _expire(self, now):
+        # Entries are kept in insertion order, so expired ones are at the front
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if now - oldest["verified_at"] <= self.ttl:
+                break
+            self._remove(oldest["id"])
+            self.stats["expired"] += 1
+
+    @contextmanager
+    def _log_lock(self):
+        """Hold the log's lock file; OSError (so the caller skips the write) if another process keeps it"""
+        lock_path = f"{self.path}.lock"
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+                        os.remove(lock_path)  # left behind by a process that died holding it
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{lock_path} is held by another process")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def _append_log(self, entry):
+        if not self.path:
+            return
+        try:
+            with self._log_lock():
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+                self._log_lines += 1
+                if self._log_lines > 2 * self.max_entries:
+                    self._compact()
+        except OSError:
+            pass
+
+    def _compact(self):
+        """Rewrite the log with only the live entries, keeping those other processes appended.
+
+        Called with the log lock held, so no append can land between the
+        read and the replace. The in-memory index is rebuilt from the merged
+        entries, oldest first, so eviction keeps the newest across processes.
+        """
+        merged = {entry["id"]: entry for entry in self._read_log()}
+        merged.update(self._entries)
+        self._entries.clear()
+        self._buckets.clear()
+        for entry in sorted(merged.values(), key=lambda entry: entry["verified_at"]):
+            self._insert(entry)
+        self._expire(time.time())
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
+
+    def _read_log(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line from a crash
+                    if len(entry.get("signature") or ()) == self.num_perm:
+                        yield entry
+        except OSError:
+            return
+
+    def _load(self):
+        for entry in self._read_log():
+            self._insert(entry)
+            self._log_lines += 1
+        self._expire(time.time())
@@ -0,0 +1,242 @@
+"""
+Shared HTTP client for the LLM providers
+Per-host keep-alive connection pools, separate connect/read timeouts, gzip decoding
+and line-by-line streaming for Server-Sent Events
+"""
+
+import gzip
+import http.client
+import json
+import queue
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 8
+
+# Raised when a pooled socket turns out to have been closed by the server
+# while it sat idle; the request is retried once on a fresh connection.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class ProviderHTTPError(Exception):
+    """Non-2xx reply from a provider; carries the status code and response body"""
+
+    def __init__(self, code, body):
+        super().__init__(f"HTTP Error {code}")
+        self.code = code
+        self.body = body
+
+
+class ProviderResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode("utf-8"))
+
+
+class StreamingResponse:
+    """A response body read line by line; the connection returns to the pool once fully read"""
+
+    def __init__(self, client, pool, conn, resp, reused):
+        self.status = resp.status
+        self.content_type = resp.getheader("Content-Type", "")
+        self._client = client
+        self._pool = pool
+        self._conn = conn
+        self._resp = resp
+        self._reused = reused
+        self._done = False
+
+    def iter_lines(self):
+        clean = False
+        try:
+            while True:
+                line = self._resp.readline()
+                if not line:
+                    break
+                yield line.decode("utf-8").rstrip("\r\n")
+            clean = True
+        finally:
+            self._close(clean)
+
+    def read(self):
+        try:
+            data = self._resp.read()
+        except Exception:
+            self._close(False)
+            raise
+        self._close(True)
+        return data
+
+    def close(self):
+        """Abandon the rest of the body; the connection cannot be reused"""
+        self._close(False)
+
+    def _close(self, clean):
+        if not self._done:
+            self._done = True
+            self._client._finish(self._pool, self._conn, self._resp, self._reused, clean)
+
+
+def iter_sse_data(lines):
+    """Yield the data payload of each Server-Sent Event from an iterator of lines"""
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield "\n".join(data)
+
+
+class ConnectionPool:
+    """Idle keep-alive connections to one scheme://host:port"""
+
+    def __init__(self, scheme, host, port, maxsize, connect_timeout):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._idle = queue.LifoQueue(maxsize)
+        self.opened = 0
+
+    def acquire(self):
+        """Return (connection, reused)"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        conn_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        conn = conn_class(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        self.opened += 1
+        return conn, False
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ProviderClient:
+    """Thread-safe HTTP client that reuses connections across requests"""
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+
+    def _pool_for(self, parts):
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(scheme, parts.hostname, port, self.pool_size, self.connect_timeout)
+                self._pools[key] = pool
+            return pool
+
+    def _send(self, method, url, body, headers, read_timeout, accept_encoding="gzip"):
+        """Send a request on a pooled connection; returns (pool, conn, response, reused)"""
+        parts = urlsplit(url)
+        pool = self._pool_for(parts)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request_headers = {"Connection": "keep-alive", "Accept-Encoding": accept_encoding}
+        request_headers.update(headers or {})
+
+        for attempt in range(2):
+            conn, reused = pool.acquire()
+            try:
+                conn.sock.settimeout(read_timeout or self.read_timeout)
+                conn.request(method, path, body=body, headers=request_headers)
+                return pool, conn, conn.getresponse(), reused
+            except _STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+    def _finish(self, pool, conn, resp, reused, clean=True):
+        if clean and not resp.will_close:
+            pool.release(conn)
+        else:
+            conn.close()
+        with self._lock:
+            self.requests += 1
+            self.reused += int(reused)
+
+    def request(self, method, url, body=None, headers=None, read_timeout=None):
+        pool, conn, resp, reused = self._send(method, url, body, headers, read_timeout)
+        try:
+            data = resp.read()
+        except Exception:
+            self._finish(pool, conn, resp, reused, clean=False)
+            raise
+        self._finish(pool, conn, resp, reused)
+
+        if resp.getheader("Content-Encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        return ProviderResponse(resp.status, dict(resp.getheaders()), data)
+
+    def open_stream(self, url, payload, headers=None, read_timeout=None):
+        """POST a JSON body and return a StreamingResponse for reading the reply incrementally.
+
+        Raises ProviderHTTPError on non-2xx. Streams ask for an uncompressed
+        body so every line can be handed on as soon as it arrives.
+        """
+        request_headers = {"Content-Type": "application/json", "Accept": "text/event-stream, application/json"}
+        request_headers.update(headers or {})
+        body = json.dumps(payload).encode("utf-8")
+        pool, conn, resp, reused = self._send("POST", url, body, request_headers, read_timeout, accept_encoding="identity")
+        stream = StreamingResponse(self, pool, conn, resp, reused)
+        if resp.status >= 400:
+            raise ProviderHTTPError(resp.status, stream.read().decode("utf-8", "replace"))
+        return stream
+
+    def post_json(self, url, payload, headers=None, read_timeout=None):
+        """POST a JSON body and return the decoded JSON reply; raises ProviderHTTPError on non-2xx"""
+        request_headers = {"Content-Type": "application/json"}
+        request_headers.update(headers or {})
+        resp = self.request("POST", url, json.dumps(payload).encode("utf-8"), request_headers, read_timeout)
+        if resp.status >= 400:
+            raise ProviderHTTPError(resp.status, resp.body.decode("utf-8", "replace"))
+        return resp.json()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "reused": self.reused,
+                "connections_opened": sum(pool.opened for pool in self._pools.values())
+            }
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
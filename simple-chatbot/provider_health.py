@@ -0,0 +1,234 @@
+"""
+Provider health tracking for the Truth Engine
+Rolling error rate / p95 latency per provider, circuit breakers with
+half-open probing, and health-aware ordering of the fallback chain
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderState:
+    def __init__(self, window_size):
+        self.samples = deque(maxlen=window_size)  # (timestamp, ok, latency_seconds)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = 0.0
+        self.probe_started = None
+        self.updated = 0.0  # when the breaker fields last changed, to merge with other processes
+
+    def to_dict(self):
+        return {
+            "samples": list(self.samples),
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_until": self.open_until,
+            "cooldown": self.cooldown,
+            "updated": self.updated
+        }
+
+    @classmethod
+    def from_dict(cls, data, window_size):
+        state = cls(window_size)
+        state.samples.extend(tuple(sample) for sample in data.get("samples", []))
+        state.state = data.get("state", CLOSED)
+        state.consecutive_failures = data.get("consecutive_failures", 0)
+        state.open_until = data.get("open_until", 0.0)
+        state.cooldown = data.get("cooldown", 0.0)
+        state.updated = data.get("updated", 0.0)
+        return state
+
+    def merge(self, other):
+        """Take in what another process saw: the union of samples, and its breaker if more recent"""
+        samples = sorted(set(self.samples) | set(other.samples))
+        self.samples.clear()
+        self.samples.extend(samples[-self.samples.maxlen:])
+        if other.updated > self.updated:
+            self.state = other.state
+            self.consecutive_failures = other.consecutive_failures
+            self.open_until = other.open_until
+            self.cooldown = other.cooldown
+            self.updated = other.updated
+
+
+class ProviderHealth:
+    """Circuit breaker and latency bookkeeping shared by every request in the process.
+
+    A breaker opens when a provider fails `failure_threshold` times in a row,
+    or when at least `min_samples` recent calls show an error rate of
+    `error_rate_threshold` or more. After the cooldown one probe request is let
+    through (half-open); success closes the breaker, failure reopens it with a
+    doubled cooldown.
+
+    With `state_path` set, state is shared through a small JSON file so
+    short-lived and concurrent worker processes use what the others
+    observed: at most every `save_interval` seconds (and at exit) the file
+    is read, merged with this process's state and written back.
+    """
+
+    def __init__(self, window_size=20, window_seconds=300, min_samples=5, error_rate_threshold=0.5,
+                 failure_threshold=3, cooldown=15.0, max_cooldown=300.0, state_path=None, save_interval=1.0):
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state_path = state_path
+        self.save_interval = save_interval
+        self._providers = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+        if state_path:
+            self._load()
+            atexit.register(self.flush)
+
+    def _get(self, name):
+        state = self._providers.get(name)
+        if state is None:
+            state = self._providers[name] = ProviderState(self.window_size)
+        return state
+
+    def _recent(self, state, now):
+        return [s for s in state.samples if now - s[0] <= self.window_seconds]
+
+    def allow(self, name):
+        """Whether a request may go to this provider right now"""
+        now = time.time()
+        with self._lock:
+            self._maybe_save(now)
+            state = self._get(name)
+            if state.state == CLOSED:
+                return True
+            if state.state == OPEN and now < state.open_until:
+                return False
+            # Cooldown over: let exactly one probe through until it reports back
+            if state.probe_started is not None and now - state.probe_started < state.cooldown:
+                return False
+            state.state = HALF_OPEN
+            state.probe_started = now
+            return True
+
+    def record(self, name, ok, latency):
+        now = time.time()
+        with self._lock:
+            state = self._get(name)
+            state.samples.append((now, bool(ok), latency))
+            self._dirty = True
+            was_probe = state.state == HALF_OPEN
+            state.probe_started = None
+
+            if ok:
+                state.consecutive_failures = 0
+                if was_probe:
+                    state.state = CLOSED
+                    state.cooldown = 0.0
+                    # Forget the failures that opened the breaker
+                    state.samples.clear()
+                    state.samples.append((now, True, latency))
+            else:
+                state.consecutive_failures += 1
+                recent = self._recent(state, now)
+                errors = sum(1 for s in recent if not s[1])
+                tripped = (
+                    state.consecutive_failures >= self.failure_threshold
+                    or (len(recent) >= self.min_samples and errors / len(recent) >= self.error_rate_threshold)
+                )
+                if was_probe or (state.state == CLOSED and tripped):
+                    state.cooldown = min(self.max_cooldown, state.cooldown * 2) if was_probe and state.cooldown else self.base_cooldown
+                    state.state = OPEN
+                    state.open_until = now + state.cooldown
+            state.updated = now
+            self._maybe_save(now)
+
+    def summary(self, name):
+        now = time.time()
+        with self._lock:
+            state = self._get(name)
+            recent = self._recent(state, now)
+            latencies = sorted(s[2] for s in recent)
+            return {
+                "state": state.state,
+                "samples": len(recent),
+                "error_rate": round(sum(1 for s in recent if not s[1]) / len(recent), 3) if recent else 0.0,
+                "p95_latency": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3) if latencies else None,
+                "open_for": round(max(0.0, state.open_until - now), 1) if state.state == OPEN else 0.0
+            }
+
+    def order(self, names):
+        """Sort providers healthiest first, keeping the configured order among equals.
+
+        A provider holding a half-open probe goes first so the probe is
+        actually sent. Error rate is compared in 10% steps and p95 latency in
+        1 s steps so small fluctuations don't reshuffle the chain on every request.
+        """
+        state_rank = {HALF_OPEN: 0, CLOSED: 1, OPEN: 2}
+
+        def key(item):
+            index, name = item
+            info = self.summary(name)
+            rank = state_rank[info["state"]]
+            if rank != 1 or info["samples"] < self.min_samples:
+                # Too little data to judge; the breaker still handles hard failures
+                return (rank, 0.0, 0, index)
+            return (rank, round(info["error_rate"], 1), int(info["p95_latency"]), index)
+        return [name for index, name in sorted(enumerate(names), key=key)]
+
+    def snapshot(self):
+        with self._lock:
+            names = list(self._providers)
+        return {name: self.summary(name) for name in names}
+
+    def flush(self):
+        """Write any unsaved state now (registered to run at exit)"""
+        with self._lock:
+            if self._dirty:
+                self._save(time.time())
+
+    def _maybe_save(self, now):
+        if not self.state_path or now - self._last_save < self.save_interval:
+            return
+        if self._dirty:
+            self._save(now)
+        else:
+            # Nothing new here, but other processes may have learnt something
+            self._last_save = now
+            self._load()
+
+    def _save(self, now):
+        """Merge the file's state into ours, then write the result back"""
+        self._last_save = now
+        self._load()
+        self._dirty = False
+        data = {name: state.to_dict() for name, state in self._providers.items()}
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, state in data.items():
+            saved = ProviderState.from_dict(state, self.window_size)
+            if name in self._providers:
+                self._providers[name].merge(saved)
+            else:
+                self._providers[name] = saved
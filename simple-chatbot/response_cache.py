@@ -0,0 +1,141 @@
+"""
+Response cache for the Truth Engine
+In-memory LRU with per-mode TTLs and an optional SQLite tier that survives restarts
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached answer stays valid, per chat mode
+DEFAULT_TTLS = {
+    "chat": 3600,
+    "research": 6 * 3600,
+    "thinking": 3600,
+    "shopping": 900,
+    "verify": 1800
+}
+DEFAULT_TTL = 3600
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Case, spacing and trailing punctuation should not create separate cache entries"""
+    return _WHITESPACE_RE.sub(" ", message.lower()).strip().rstrip("?!. ")
+
+
+def cache_key(message, mode, kb_version):
+    raw = f"{kb_version}\x00{mode}\x00{normalize_message(message)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache keyed on (normalized message, mode, KB version)"""
+
+    def __init__(self, max_entries=1000, ttls=None, db_path=None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._entries = OrderedDict()  # key -> (expires_at, kb_version, response)
+        self._lock = threading.Lock()
+        self._kb_version = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expired": 0,
+            "invalidations": 0
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, kb_version TEXT, mode TEXT, "
+                "response TEXT, expires_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires_at)")
+            self._db.commit()
+
+    def ttl_for(self, mode):
+        return self.ttls.get(mode, DEFAULT_TTL)
+
+    def set_kb_version(self, kb_version):
+        """Drop everything cached against an older knowledge base"""
+        with self._lock:
+            if kb_version == self._kb_version:
+                return
+            if self._kb_version is not None:
+                self.stats["invalidations"] += 1
+            self._kb_version = kb_version
+            stale = [key for key, entry in self._entries.items() if entry[1] != kb_version]
+            for key in stale:
+                del self._entries[key]
+            if self._db:
+                self._db.execute("DELETE FROM responses WHERE kb_version != ?", (kb_version,))
+                self._db.commit()
+
+    def get(self, message, mode, kb_version):
+        key = cache_key(message, mode, kb_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return entry[2]
+                del self._entries[key]
+                self.stats["expired"] += 1
+
+            if self._db:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._store(key, (row[1], kb_version, row[0]))
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, message, mode, kb_version, response):
+        key = cache_key(message, mode, kb_version)
+        expires_at = time.time() + self.ttl_for(mode)
+        with self._lock:
+            self._store(key, (expires_at, kb_version, response))
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, kb_version, mode, response, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, kb_version, mode, response, expires_at)
+                )
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def snapshot(self):
+        """Counters plus current size, for the worker's stats action"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+            )
@@ -0,0 +1,102 @@
+"""
+Knowledge base retrieval for the Truth Engine
+BM25 ranking over an inverted index that is built once per KB load
+"""
+
+import hashlib
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"\w+")
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from',
+    'has', 'have', 'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'the',
+    'this', 'that', 'to', 'what', 'when', 'where', 'which', 'who', 'why', 'will', 'with', 'you'
+}
+
+# Curated keywords are a much stronger signal than free text, so their terms
+# count several times towards a passage's term frequency.
+FIELD_WEIGHTS = {
+    "keywords": 3,
+    "topic": 2,
+    "content": 1
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens with stop words removed"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def file_sha256(path):
+    """Content hash of a file, used as the knowledge base version"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _field_text(item, field):
+    value = item.get(field) or ""
+    if isinstance(value, list):
+        value = " ".join(value)
+    return value
+
+
+class BM25Index:
+    """Inverted index over KB entries scored with Okapi BM25"""
+
+    def __init__(self, items, k1=1.5, b=0.75):
+        self.items = items
+        self.k1 = k1
+        self.b = b
+
+        postings = defaultdict(list)  # term -> [(doc_id, weighted term frequency)]
+        doc_lengths = []
+        for doc_id, item in enumerate(items):
+            term_freqs = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(_field_text(item, field)):
+                    term_freqs[term] += weight
+            doc_lengths.append(sum(term_freqs.values()))
+            for term, freq in term_freqs.items():
+                postings[term].append((doc_id, freq))
+
+        self.postings = dict(postings)
+        n_docs = len(items)
+        avg_length = (sum(doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        # Per-document part of the BM25 denominator, so queries only do lookups
+        self.length_norms = [
+            k1 * (1 - b + b * (length / avg_length if avg_length else 0.0))
+            for length in doc_lengths
+        ]
+
+    def __len__(self):
+        return len(self.items)
+
+    def score(self, query):
+        """Return {doc_id: BM25 score} for every passage sharing a term with the query"""
+        scores = defaultdict(float)
+        k1 = self.k1
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs:
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + self.length_norms[doc_id])
+        return scores
+
+    def search(self, query, top_k=2):
+        """Return up to top_k (item, score) pairs, best first"""
+        scores = self.score(query)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda hit: hit[1])
+        return [(self.items[doc_id], score) for doc_id, score in best]
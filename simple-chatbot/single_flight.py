@@ -0,0 +1,118 @@
+"""
+Request coalescing for the Truth Engine
+Concurrent identical requests share one upstream call instead of each making their own
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, wait
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A waiter gave up on the in-flight call it had joined"""
+
+
+class _Call:
+    __slots__ = ("future", "waiters", "started")
+
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+        self.started = time.monotonic()
+
+
+class SingleFlight:
+    """At most one call per key runs at a time; callers arriving meanwhile wait for its outcome.
+
+    The first caller for a key (the leader) runs fn; everyone else with the
+    same key waits until it finishes and gets the same result, or has the
+    same exception raised. Waiters give up after max_wait seconds with
+    SingleFlightTimeout. Nothing is kept once a call finishes: the next
+    caller starts a new call (caching results is the response cache's job).
+
+    do() blocks its thread; ado() is the same for coroutines on an event
+    loop, and both kinds of caller can share one call.
+    """
+
+    def __init__(self, max_wait=30.0):
+        self.max_wait = max_wait
+        self._calls = {}  # key -> _Call in flight
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def _join(self, key):
+        """Returns (call, leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.stats["calls"] += 1
+                return call, True
+            call.waiters += 1
+            self.stats["coalesced"] += 1
+            return call, False
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if error is not None:
+                self.stats["errors"] += 1
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+
+    def _timed_out(self, timeout):
+        with self._lock:
+            self.stats["timeouts"] += 1
+        return SingleFlightTimeout(f"identical request still running after {timeout}s")
+
+    def do(self, key, fn, max_wait=None):
+        """Run fn() or join the identical call already running; returns (result, shared)"""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self._finish(key, call, error=e)
+                raise
+            self._finish(key, call, result)
+            return result, False
+
+        timeout = self.max_wait if max_wait is None else max_wait
+        if not wait([call.future], timeout).done:
+            raise self._timed_out(timeout)
+        return call.future.result(), True
+
+    async def ado(self, key, fn, max_wait=None):
+        """Await fn() or the identical call already running; returns (result, shared)"""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                result = await fn()
+            except BaseException as e:
+                self._finish(key, call, error=e)
+                raise
+            self._finish(key, call, result)
+            return result, False
+
+        timeout = self.max_wait if max_wait is None else max_wait
+        # asyncio.wait never cancels what it waits on, so giving up leaves the leader running
+        outcome = asyncio.wrap_future(call.future)
+        done, _ = await asyncio.wait([outcome], timeout=timeout)
+        if not done:
+            raise self._timed_out(timeout)
+        return outcome.result(), True
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            oldest = min((now - call.started for call in self._calls.values()), default=None)
+            return dict(
+                self.stats,
+                in_flight=len(self._calls),
+                oldest_in_flight_ms=round(oldest * 1000, 1) if oldest is not None else None,
+                max_wait=self.max_wait
+            )
@@ -0,0 +1,173 @@
+"""
+Local stub of the OpenRouter, OpenAI and Gemini chat endpoints
+Used to exercise ai_service without network access or API spend
+
+Point the providers at it with:
+    OPENROUTER_BASE_URL=http://127.0.0.1:8089 OPENAI_BASE_URL=http://127.0.0.1:8089 \
+    GEMINI_BASE_URL=http://127.0.0.1:8089 python ai_service.py "How do I get a passport?"
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VERDICT_JSON = json.dumps({
+    "status": "false",
+    "color": "red",
+    "message": "This matches a known scam pattern. The government does not ask citizens to register via links.",
+    "official_source": "https://statehouse.gov.sl"
+})
+
+
+class StubConfig:
+    """Latency and failure behaviour; can be changed while the server runs"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503, gzip_responses=False,
+                 stream_chunk_ms=20.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.gzip_responses = gzip_responses
+        self.stream_chunk_ms = stream_chunk_ms
+        self.rng = random.Random(seed)
+
+
+def _reply_text(payload):
+    """Canned answer; verification prompts get a JSON verdict like the real models return"""
+    text = json.dumps(payload)
+    if "Return ONLY a JSON object" in text:
+        return f"```json\n{VERDICT_JSON}\n```"
+    return "According to official records, this is a stub answer from the local test server."
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count("requests")
+        config = self.server.config
+
+        delay = max(0.0, config.latency_ms + config.rng.uniform(-config.jitter_ms, config.jitter_ms))
+        time.sleep(delay / 1000)
+
+        if config.rng.random() < config.error_rate:
+            self.server.count("errors")
+            return self._send(config.error_status, {"error": {"message": "stub injected failure"}})
+
+        text = _reply_text(payload)
+        if ":streamGenerateContent" in self.path:
+            return self._send_stream(text, lambda word: {"candidates": [{"content": {"parts": [{"text": word}], "role": "model"}}]})
+        if payload.get("stream") and self.path.endswith("/chat/completions"):
+            return self._send_stream(text, lambda word: {"choices": [{"index": 0, "delta": {"content": word}}]}, done_marker=True)
+        if ":generateContent" in self.path:
+            body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+        elif self.path.endswith("/chat/completions"):
+            body = {
+                "id": "stub",
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+            }
+        else:
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+        self._send(200, body)
+
+    def _send_stream(self, text, make_event, done_marker=False):
+        """Server-Sent Events over chunked transfer encoding, one word per event"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = [word + " " for word in text.split(" ")]
+        words[-1] = words[-1].rstrip()
+        events = [f"data: {json.dumps(make_event(word))}\n\n" for word in words]
+        if done_marker:
+            events.append("data: [DONE]\n\n")
+        for event in events:
+            data = event.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.server.config.stream_chunk_ms / 1000)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.server.config.gzip_responses and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """Threaded stub server that counts connections, requests and injected errors"""
+
+    daemon_threads = True
+    # socketserver's default backlog of 5 drops connects when hundreds arrive at once
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        super().__init__((host, port), StubHandler)
+        self.config = config or StubConfig()
+        self.stats = {"connections": 0, "requests": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a stub OpenRouter/OpenAI/Gemini server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    server = StubLLMServer(port=args.port, config=StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, gzip_responses=args.gzip))
+    print(f"Stub LLM server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
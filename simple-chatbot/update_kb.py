@@ -1,63 +1,68 @@
+import argparse
+import hashlib
+import itertools
 import json
+import os
 import re
+import sys
+import tempfile
+import time
+
+from kb_snapshot import KBSnapshot
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FAQ_PATH = os.path.join(BASE_DIR, "..", "ChatFAQ", "chatFAQ")
+DEFAULT_KB_PATH = os.path.join(BASE_DIR, "data", "knowledge_base.json")
+
+# "Q12: ..." / "Q12. ..." or a numbered "12. ..." question; "A:" or "Answer:" starts the answer
+QUESTION_RE = re.compile(r'^(?:Q(\d+)[:.]|(\d+)\.)\s*(.*)')
+ANSWER_RE = re.compile(r'^(?:A|Answer):\s*(.*)', re.IGNORECASE)
+# "SECTION 2 — POLICY STRUCTURE & PILLARS" starts a new section of a policy document
+SECTION_RE = re.compile(r'^SECTION\s+(\d+)\b[\s:.\-\u2013\u2014]*(.*)')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+# Running page headers/footers that are not part of the text
+NOISE_LINES = ("SL-Cyber-Security-Policy",)
+PASSAGE_MAX_CHARS = 1200
+PASSAGE_OVERLAP = 200
 
 def parse_faq(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Split by "Q[0-9]+:" to find questions
-    # This regex looks for Q followed by digits and a colon
-    pattern = re.compile(r'Q(\d+):(.*?)\nA:(.*?)(?=\nQ\d+:|$)', re.DOTALL)
-    
-    # The file structure is a bit loose, let's try a more robust split
-    # We can split by "Q<number>:"
-    
-    entries = []
-    
-    # Normalize newlines
-    content = content.replace('\r\n', '\n')
-    
-    # Find all Q&A blocks
-    # We'll iterate through the file line by line to be safer
-    lines = content.split('\n')
-    
+    qa_pairs = []
     current_q = ""
     current_a = ""
-    current_id = 0
     capturing_a = False
-    
-    qa_pairs = []
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check for Question
-        q_match = re.match(r'^Q(\d+):\s*(.*)', line)
-        if q_match:
-            # Save previous if exists
-            if current_q:
-                qa_pairs.append({'q': current_q, 'a': current_a.strip()})
-            
-            current_id = q_match.group(1)
-            current_q = q_match.group(2)
-            current_a = ""
-            capturing_a = False
-            continue
-            
-        # Check for Answer start
-        if line.startswith('A:'):
-            capturing_a = True
-            current_a += line[2:].strip() + " "
-            continue
-            
-        # If capturing answer, append line
-        if capturing_a:
-            # Stop if we hit a "SL-Cyber-Security-Policy" line or Section header
-            if "SL-Cyber-Security-Policy" in line or line.startswith("SECTION"):
+
+    # Read line by line; the newline handling also normalizes \r\n
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            # Check for Question
+            q_match = QUESTION_RE.match(line)
+            if q_match:
+                # Save previous if exists
+                if current_q:
+                    qa_pairs.append({'q': current_q, 'a': current_a.strip()})
+
+                current_q = q_match.group(3)
+                current_a = ""
+                capturing_a = False
+                continue
+
+            # Check for Answer start
+            a_match = ANSWER_RE.match(line)
+            if a_match:
+                capturing_a = True
+                current_a += a_match.group(1).strip() + " "
                 continue
-            current_a += line + " "
+
+            # If capturing answer, append line
+            if capturing_a:
+                # Stop if we hit a "SL-Cyber-Security-Policy" line or Section header
+                if "SL-Cyber-Security-Policy" in line or line.startswith("SECTION"):
+                    continue
+                current_a += line + " "
 
     # Append last one
     if current_q:
@@ -65,63 +70,344 @@ def parse_faq(file_path):
 
     return qa_pairs
 
-def generate_keywords(text):
-    # Simple keyword extraction
-    common_words = {'what', 'is', 'the', 'of', 'and', 'to', 'in', 'a', 'for', 'how', 'why', 'does', 'do', 'are', 'it', 'this', 'that', 'with', 'on', 'be', 'will', 'can', 'has', 'have', 'by', 'an', 'as', 'from', 'or'}
-    words = re.findall(r'\w+', text.lower())
-    keywords = [w for w in words if w not in common_words and len(w) > 2]
-    return list(set(keywords))[:10] # Limit to 10 keywords
+COMMON_WORDS = {'what', 'is', 'the', 'of', 'and', 'to', 'in', 'a', 'for', 'how', 'why', 'does', 'do', 'are', 'it', 'this', 'that', 'with', 'on', 'be', 'will', 'can', 'has', 'have', 'by', 'an', 'as', 'from', 'or'}
+
+def generate_keywords(text, limit=10):
+    # Simple keyword extraction: most frequent words first, ties in order of
+    # first appearance, so the same text always gives the same keywords
+    counts = {}
+    for w in re.findall(r'\w+', text.lower()):
+        if w not in COMMON_WORDS and len(w) > 2:
+            counts[w] = counts.get(w, 0) + 1
+    # dicts keep insertion order, and sorted() is stable
+    return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+def _split_pieces(text, max_chars):
+    """Sentences of a paragraph, with any sentence longer than max_chars cut on word boundaries"""
+    for sentence in SENTENCE_END_RE.split(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars + 1)
+            if cut <= 0:
+                cut = max_chars
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            yield sentence
+
+def _overlap_tail(pieces, budget):
+    """Trailing pieces of a passage that fit in `budget` characters"""
+    tail, size = [], 0
+    for piece in reversed(pieces):
+        size += len(piece) + 1
+        if size > budget:
+            break
+        tail.append(piece)
+    tail.reverse()
+    return tail
+
+def iter_passages(file_path, max_chars=PASSAGE_MAX_CHARS, overlap=PASSAGE_OVERLAP):
+    """Split a long document into passages, reading it one line at a time.
+
+    Passages never cross a "SECTION n" header and hold at most max_chars
+    characters; consecutive passages of a section share up to `overlap`
+    characters of whole sentences. Yields {"section", "title", "index", "text"}
+    as soon as each passage is complete, so memory does not grow with the
+    document.
+    """
+    if not 0 <= overlap < max_chars:
+        raise ValueError("overlap must be smaller than max_chars")
+    section, title, index = "0", "", 0
+    seen_sections = {}
+    paragraph = []
+    pieces, size, fresh = [], 0, False  # fresh: holds text not yet emitted
+
+    def passage():
+        return {"section": section, "title": title, "index": index, "text": " ".join(pieces)}
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        # The trailing "" flushes the last paragraph like a blank line would
+        for raw in itertools.chain(f, [""]):
+            line = raw.strip()
+            header = SECTION_RE.match(line)
+            if line and not header:
+                if not any(noise in line for noise in NOISE_LINES):
+                    paragraph.append(line)
+                continue
+
+            # A blank line or header ends the paragraph
+            for piece in _split_pieces(" ".join(paragraph), max_chars):
+                if fresh and size + len(piece) > max_chars:
+                    yield passage()
+                    index += 1
+                    pieces = _overlap_tail(pieces, min(overlap, max_chars - len(piece) - 1))
+                    size = sum(len(p) + 1 for p in pieces)
+                    fresh = False
+                pieces.append(piece)
+                size += len(piece) + 1
+                fresh = True
+            paragraph = []
+
+            if header:
+                if fresh:
+                    yield passage()
+                # Section numbers can repeat (e.g. appended documents), keep keys unique
+                number = header.group(1)
+                seen_sections[number] = seen_sections.get(number, 0) + 1
+                section = number if seen_sections[number] == 1 else f"{number}#{seen_sections[number]}"
+                title, index = header.group(2).strip(), 0
+                pieces, size, fresh = [], 0, False
+
+    if fresh:
+        yield passage()
+
+def iter_document_entries(file_path, source, max_chars=PASSAGE_MAX_CHARS, overlap=PASSAGE_OVERLAP):
+    """KB entries (without ids) for each passage of a document, generated lazily"""
+    for passage in iter_passages(file_path, max_chars, overlap):
+        topic = passage["title"] or f"Section {passage['section']}"
+        yield {
+            "id": None,
+            "topic": topic[:50] + "..." if len(topic) > 50 else topic,
+            "content": passage["text"],
+            "keywords": generate_keywords(f"{passage['title']} {passage['text']}"),
+            "source": source,
+            "source_key": f"section-{passage['section']}/{passage['index']}",
+            "content_hash": hashlib.sha256(passage["text"].encode('utf-8')).hexdigest()
+        }
+
+def question_key(question):
+    """Identity of a Q&A in its source: the question text, case and whitespace folded"""
+    return " ".join(question.lower().split())
+
+def content_hash(question, answer):
+    return hashlib.sha256(f"{question}\0{answer}".encode('utf-8')).hexdigest()
 
-def update_knowledge_base(faq_path, kb_path):
-    # Read existing KB
+def build_entry(item, source, key, entry_id):
+    # "Question\nAnswer" in the content, so the AI sees what the passage answers
+    return {
+        "id": entry_id,
+        "topic": item['q'][:50] + "..." if len(item['q']) > 50 else item['q'],
+        "content": f"{item['q']}\n{item['a']}",
+        "keywords": generate_keywords(item['q'] + " " + item['a']),
+        "source": source,
+        "source_key": key,
+        "content_hash": content_hash(item['q'], item['a'])
+    }
+
+def load_kb(kb_path):
     try:
         with open(kb_path, 'r', encoding='utf-8') as f:
-            kb = json.load(f)
-    except:
-        kb = []
-        
-    # Get max ID
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def write_kb_atomic(entries, kb_path, should_replace=None):
+    """Write entries to a temp file in the same directory, then rename over the KB.
+
+    Entries are written one at a time (same layout as json.dump(indent=4)), so
+    a generator can be passed without building the whole list. Readers
+    (ai_service) see either the old or the new file, never a partial one.
+    If should_replace() returns false once writing is done, the temp file
+    is discarded and the KB left alone; returns whether it was replaced.
+    """
+    kb_dir = os.path.dirname(os.path.abspath(kb_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".knowledge_base.", suffix=".tmp", dir=kb_dir)
+    try:
+        # mkstemp creates the file 0600; keep the KB readable like before
+        try:
+            os.chmod(tmp_path, os.stat(kb_path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write("[")
+            count = 0
+            for entry in entries:
+                f.write(",\n    " if count else "\n    ")
+                f.write(json.dumps(entry, indent=4).replace("\n", "\n    "))
+                count += 1
+            f.write("\n]" if count else "]")
+            f.flush()
+            os.fsync(f.fileno())
+        if should_replace is not None and not should_replace():
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, kb_path)
+        return True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def merge_entries(kb, qa_pairs, source):
+    """Upsert the parsed Q&As from `source` into kb; returns (new_kb, stats).
+
+    Entries from this source are matched on their question: unchanged ones
+    are kept as they are, changed ones are rewritten under the same id, and
+    ones no longer in the source are dropped. Untagged entries whose topic or
+    first line is one of the questions (from older append-only runs) are
+    adopted the same way; any further copies of them are dropped.
+    Everything else in the KB is left untouched.
+    """
+    # A question asked again later in the source is "question#2", and so on
+    parsed = {}
+    for item in qa_pairs:
+        base = key = question_key(item['q'])
+        occurrence = 1
+        while key in parsed:
+            occurrence += 1
+            key = f"{base}#{occurrence}"
+        parsed[key] = item
+
     max_id = 0
-    for item in kb:
+    for entry in kb:
         try:
-            if int(item['id']) > max_id:
-                max_id = int(item['id'])
-        except:
+            max_id = max(max_id, int(entry['id']))
+        except (KeyError, TypeError, ValueError):
             pass
-            
-    # Parse FAQ
+
+    stats = {"unchanged": 0, "updated": 0, "added": 0, "removed": 0}
+    claimed = set()
+    merged = []
+    for entry in kb:
+        if entry.get("source") == source:
+            key = entry.get("source_key")
+        elif "source" not in entry:
+            key = question_key(entry.get("topic", ""))
+            if key not in parsed:
+                key = question_key(entry.get("content", "").split("\n", 1)[0])
+            if key not in parsed:
+                merged.append(entry)
+                continue
+            base, occurrence = key, 1
+            while key in claimed and f"{base}#{occurrence + 1}" in parsed:
+                occurrence += 1
+                key = f"{base}#{occurrence}"
+        else:
+            merged.append(entry)  # belongs to another source
+            continue
+
+        if key not in parsed or key in claimed:
+            stats["removed"] += 1
+            continue
+        claimed.add(key)
+        item = parsed[key]
+        if entry.get("source") == source and entry.get("content_hash") == content_hash(item['q'], item['a']):
+            merged.append(entry)
+            stats["unchanged"] += 1
+        else:
+            merged.append(build_entry(item, source, key, entry['id']))
+            stats["updated"] += 1
+
+    for key, item in parsed.items():
+        if key not in claimed:
+            max_id += 1
+            merged.append(build_entry(item, source, key, str(max_id)))
+            stats["added"] += 1
+    return merged, stats
+
+def update_knowledge_base(faq_path, kb_path, source=None, dry_run=False):
+    start = time.perf_counter()
+    source = source or os.path.basename(faq_path)
+    kb = load_kb(kb_path)
     new_qa = parse_faq(faq_path)
-    
-    # Add to KB
-    for item in new_qa:
-        max_id += 1
-        
-        # Combine Q and A for content, or just use A?
-        # The user wants the chatbot to answer these questions.
-        # The "content" field is what the AI uses for context.
-        # So we should put "Question: ... Answer: ..." in the content so the AI knows the context.
-        
-        content = f"{item['q']}\n{item['a']}"
-        
-        # Generate keywords from Question and Answer
-        keywords = generate_keywords(item['q'] + " " + item['a'])
-        
-        new_entry = {
-            "id": str(max_id),
-            "topic": item['q'][:50] + "..." if len(item['q']) > 50 else item['q'],
-            "content": content,
-            "keywords": keywords
-        }
-        
-        kb.append(new_entry)
-        
-    # Write back
-    with open(kb_path, 'w', encoding='utf-8') as f:
-        json.dump(kb, f, indent=4)
-        
-    print(f"Added {len(new_qa)} new entries to knowledge base.")
+
+    merged, stats = merge_entries(kb, new_qa, source)
+    changed = stats["updated"] or stats["added"] or stats["removed"]
+    # Leave the file (and its mtime) alone when nothing changed
+    if changed and not dry_run:
+        write_kb_atomic(merged, kb_path)
+
+    stats["entries"] = len(merged)
+    stats["written"] = bool(changed and not dry_run)
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"{source}: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+          f"{stats['unchanged']} unchanged ({stats['entries']} entries, {stats['seconds']}s)"
+          + ("" if stats["written"] else " - knowledge base not rewritten"))
+    return stats
+
+def ingest_document(doc_path, kb_path, source=None, max_chars=PASSAGE_MAX_CHARS, overlap=PASSAGE_OVERLAP, dry_run=False):
+    """Sync the passages of a long document into the KB.
+
+    Passages are streamed straight into the new KB file; unchanged ones keep
+    their entry (and id), changed ones keep their id, and passages that no
+    longer exist are dropped.
+    """
+    start = time.perf_counter()
+    source = source or os.path.basename(doc_path)
+    kb = load_kb(kb_path)
+    existing = {entry.get("source_key"): entry for entry in kb if entry.get("source") == source}
+    max_id = 0
+    for entry in kb:
+        try:
+            max_id = max(max_id, int(entry['id']))
+        except (KeyError, TypeError, ValueError):
+            pass
+    stats = {"unchanged": 0, "updated": 0, "added": 0, "removed": 0, "entries": 0}
+
+    def entries():
+        nonlocal max_id
+        for entry in kb:
+            if entry.get("source") != source:
+                stats["entries"] += 1
+                yield entry
+        for entry in iter_document_entries(doc_path, source, max_chars, overlap):
+            old = existing.pop(entry["source_key"], None)
+            stats["entries"] += 1
+            if old is not None and old.get("content_hash") == entry["content_hash"]:
+                stats["unchanged"] += 1
+                yield old
+                continue
+            if old is not None:
+                entry["id"] = old["id"]
+                stats["updated"] += 1
+            else:
+                max_id += 1
+                entry["id"] = str(max_id)
+                stats["added"] += 1
+            yield entry
+        stats["removed"] = len(existing)
+
+    def changed():
+        return not dry_run and bool(stats["updated"] or stats["added"] or stats["removed"])
+
+    if dry_run:
+        for _ in entries():
+            pass
+        stats["written"] = False
+    else:
+        stats["written"] = write_kb_atomic(entries(), kb_path, should_replace=changed)
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"{source}: {stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+          f"{stats['unchanged']} unchanged passages ({stats['entries']} entries, {stats['seconds']}s)"
+          + ("" if stats["written"] else " - knowledge base not rewritten"))
+    return stats
+
+def refresh_snapshot(kb_path):
+    """Recompile the KB snapshot that ai_service maps, if it is missing or older than the KB"""
+    snapshot = KBSnapshot.load(kb_path)
+    print(f"Snapshot {snapshot.path}: {len(snapshot)} entries, {snapshot.terms} terms")
+    snapshot.close()
 
 if __name__ == "__main__":
-    faq_file = r"c:\Users\medvo\Desktop\GOV-AI CHATBOX\ChatFAQ\chatFAQ"
-    kb_file = r"c:\Users\medvo\Desktop\GOV-AI CHATBOX\simple-chatbot\data\knowledge_base.json"
-    update_knowledge_base(faq_file, kb_file)
+    parser = argparse.ArgumentParser(description="Sync Q&A entries from an FAQ file, or passages from a long document, into the knowledge base")
+    parser.add_argument("--faq", default=DEFAULT_FAQ_PATH, help="FAQ file (Qn:/A: layout)")
+    parser.add_argument("--document", help="Long document (e.g. a policy) to split into passages instead of an FAQ")
+    parser.add_argument("--max-chars", type=int, default=PASSAGE_MAX_CHARS, help="Maximum passage length for --document")
+    parser.add_argument("--overlap", type=int, default=PASSAGE_OVERLAP, help="Characters shared by consecutive passages for --document")
+    parser.add_argument("--kb", default=DEFAULT_KB_PATH, help="knowledge_base.json to update")
+    parser.add_argument("--source", help="Source name stored on each entry (default: FAQ file name)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--no-snapshot", action="store_true", help="Do not recompile the KB snapshot afterwards")
+    args = parser.parse_args()
+
+    try:
+        if args.document:
+            ingest_document(args.document, args.kb, source=args.source, max_chars=args.max_chars,
+                            overlap=args.overlap, dry_run=args.dry_run)
+        else:
+            update_knowledge_base(args.faq, args.kb, source=args.source, dry_run=args.dry_run)
+        if not args.dry_run and not args.no_snapshot:
+            refresh_snapshot(args.kb)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"Error updating knowledge base: {e}\n")
+        sys.exit(1)
@@ -1,43 +1,153 @@
 const { spawn } = require('child_process');
 const path = require('path');
 
-const processMessage = (message, mode = 'chat') => {
-    return new Promise((resolve, reject) => {
-        const pythonProcess = spawn('python', [path.join(__dirname, '../ai_service.py'), '--mode', mode, message], {
-            env: { ...process.env }
-        });
+const AI_SERVICE_PATH = path.join(__dirname, '../ai_service.py');
 
-        let dataString = '';
+// Long-lived Python worker (ai_service.py --serve). It loads the knowledge base
+// once and answers newline-delimited JSON requests, so we don't pay interpreter
+// startup on every message. Set AI_WORKER_MODE=spawn to go back to one process per request.
+const USE_WORKER = process.env.AI_WORKER_MODE !== 'spawn';
 
-        pythonProcess.stdout.on('data', (data) => {
-            dataString += data.toString();
-        });
+let worker = null;
+let workerBuffer = '';
+let nextRequestId = 1;
+const pendingRequests = new Map();
 
-        pythonProcess.stderr.on('data', (data) => {
-            console.error(`Python Error: ${data}`);
-        });
+const getWorker = () => {
+    if (worker) return worker;
 
-        pythonProcess.on('close', (code) => {
+    const proc = spawn('python', [AI_SERVICE_PATH, '--serve'], {
+        cwd: path.join(__dirname, '..'),
+        env: { ...process.env }
+    });
+    worker = proc;
+    workerBuffer = '';
+
+    proc.stdout.on('data', (data) => {
+        workerBuffer += data.toString();
+        let newline;
+        while ((newline = workerBuffer.indexOf('\n')) >= 0) {
+            const line = workerBuffer.slice(0, newline).trim();
+            workerBuffer = workerBuffer.slice(newline + 1);
+            if (!line) continue;
+
+            let reply;
             try {
-                const result = JSON.parse(dataString);
-                const botResponse = result.response || "Sorry, I couldn't process that.";
-                resolve(botResponse);
+                reply = JSON.parse(line);
             } catch (e) {
-                console.error('Error parsing Python output:', e);
-                reject(e);
+                console.error('Error parsing Python worker output:', e);
+                continue;
             }
-        });
+
+            const pending = pendingRequests.get(reply.id);
+            if (!pending) continue;
+            if (reply.delta !== undefined) {
+                // Streaming chunk; the request stays pending until the final record
+                if (pending.onDelta) pending.onDelta(reply.delta);
+                continue;
+            }
+            pendingRequests.delete(reply.id);
+            if (reply.error) {
+                pending.reject(new Error(reply.error));
+            } else {
+                pending.resolve(reply);
+            }
+        }
+    });
+
+    let stderrBuffer = '';
+    proc.stderr.on('data', (data) => {
+        stderrBuffer += data.toString();
+        let newline;
+        while ((newline = stderrBuffer.indexOf('\n')) >= 0) {
+            const line = stderrBuffer.slice(0, newline);
+            stderrBuffer = stderrBuffer.slice(newline + 1);
+            if (!line.trim()) continue;
+            // Timing spans from metrics.py are structured logs, not errors
+            if (line.startsWith('{"span"')) {
+                console.log(`Python span: ${line}`);
+            } else {
+                console.error(`Python Error: ${line}`);
+            }
+        }
     });
+
+    const failPending = (err) => {
+        for (const pending of pendingRequests.values()) {
+            pending.reject(err);
+        }
+        pendingRequests.clear();
+    };
+    const onExit = (err) => {
+        // A worker we already replaced must not touch its successor's requests
+        if (worker !== proc) return;
+        worker = null;
+        failPending(err || new Error('Python worker exited'));
+    };
+    proc.on('error', onExit);
+    proc.on('close', () => onExit());
+    // Writing to a worker that is exiting fails with EPIPE; unhandled, that would crash the server
+    proc.stdin.on('error', (err) => {
+        console.error('Python worker stdin error:', err.message);
+        if (worker !== proc) return;
+        worker = null;
+        failPending(err);
+        proc.kill();
+        getWorker();
+    });
+
+    return proc;
 };
 
-const verifyMessage = (message, imageUrl = null) => {
+const sendToWorker = (request, onDelta = null) => {
     return new Promise((resolve, reject) => {
-        const args = [path.join(__dirname, '../ai_service.py'), '--verify', message];
-        if (imageUrl) {
-            args.push('--image_url', imageUrl);
+        const id = nextRequestId++;
+        pendingRequests.set(id, { resolve, reject, onDelta });
+        try {
+            getWorker().stdin.write(JSON.stringify({ ...request, id }) + '\n');
+        } catch (e) {
+            pendingRequests.delete(id);
+            reject(e);
         }
+    });
+};
+
+// One-shot processes are the fallback when the worker is down (or AI_WORKER_MODE=spawn);
+// cap how many run at once so a traffic spike queues here instead of forking a Python per request
+const MAX_SPAWNED = parseInt(process.env.AI_MAX_PROCESSES || '4', 10);
+let spawnedCount = 0;
+const spawnWaiters = [];
+
+const acquireSpawnSlot = () => {
+    if (spawnedCount < MAX_SPAWNED) {
+        spawnedCount++;
+        return Promise.resolve();
+    }
+    return new Promise((resolve) => spawnWaiters.push(resolve));
+};
+
+const releaseSpawnSlot = () => {
+    // Hand the slot straight to the next waiter so a new caller cannot overtake it
+    const next = spawnWaiters.shift();
+    if (next) {
+        next();
+    } else {
+        spawnedCount--;
+    }
+};
 
-        const pythonProcess = spawn('python', args, {
+const spawnAiService = async (args) => {
+    await acquireSpawnSlot();
+    try {
+        return await runAiService(args);
+    } finally {
+        releaseSpawnSlot();
+    }
+};
+
+const runAiService = (args) => {
+    return new Promise((resolve, reject) => {
+        const pythonProcess = spawn('python', [AI_SERVICE_PATH, ...args], {
             env: { ...process.env }
         });
 
@@ -51,11 +161,11 @@ const verifyMessage = (message, imageUrl = null) => {
             console.error(`Python Error: ${data}`);
         });
 
+        pythonProcess.on('error', reject);
+
         pythonProcess.on('close', (code) => {
             try {
-                // The python script returns JSON directly for verify
-                const result = JSON.parse(dataString);
-                resolve(result);
+                resolve(JSON.parse(dataString));
             } catch (e) {
                 console.error('Error parsing Python output:', e);
                 reject(e);
@@ -64,4 +174,81 @@ const verifyMessage = (message, imageUrl = null) => {
     });
 };
 
-module.exports = { processMessage, verifyMessage };
+const processMessage = async (message, mode = 'chat') => {
+    let result;
+    if (USE_WORKER) {
+        try {
+            result = await sendToWorker({ action: 'chat', message, mode });
+        } catch (e) {
+            console.error('Python worker failed, falling back to one-shot process:', e.message);
+        }
+    }
+    if (!result) {
+        result = await spawnAiService(['--mode', mode, message]);
+    }
+    return result.response || "Sorry, I couldn't process that.";
+};
+
+const verifyMessage = async (message, imageUrl = null) => {
+    if (USE_WORKER) {
+        let reply = null;
+        try {
+            reply = await sendToWorker({ action: 'verify', message, image_url: imageUrl });
+        } catch (e) {
+            console.error('Python worker failed, falling back to one-shot process:', e.message);
+        }
+        if (reply) {
+            // The worker returns the same JSON string the one-shot --verify prints. The claim was
+            // already verified upstream, so a bad reply is not worth a second (paid) verification
+            try {
+                return JSON.parse(reply.response);
+            } catch (e) {
+                console.error('Error parsing Python worker verdict:', e);
+                return {
+                    status: 'unverified',
+                    color: 'yellow',
+                    message: 'Error reading the verification result. Please try again shortly.',
+                    official_source: null
+                };
+            }
+        }
+    }
+
+    const args = ['--verify', message];
+    if (imageUrl) {
+        args.push('--image_url', imageUrl);
+    }
+    return spawnAiService(args);
+};
+
+// Streams the answer: onDelta is called with each text chunk as the model produces it.
+// Resolves with the final record ({ response, mode, ttft_ms, total_ms }).
+const streamMessage = async (message, mode = 'chat', onDelta = () => {}) => {
+    if (USE_WORKER) {
+        let streamed = false;
+        try {
+            return await sendToWorker({ action: 'chat', message, mode, stream: true }, (delta) => {
+                streamed = true;
+                onDelta(delta);
+            });
+        } catch (e) {
+            // Part of the answer already went out; starting over would repeat it
+            if (streamed) throw e;
+            console.error('Python worker failed, falling back to one-shot process:', e.message);
+        }
+    }
+
+    // No worker: get the whole answer at once and hand it over as a single chunk
+    const response = await processMessage(message, mode);
+    onDelta(response);
+    return { response, mode, done: true };
+};
+
+// Prometheus text-format dump of the worker's latency histograms (worker mode only)
+const getMetrics = async () => {
+    if (!USE_WORKER) return null;
+    const reply = await sendToWorker({ action: 'metrics' });
+    return reply.metrics;
+};
+
+module.exports = { processMessage, verifyMessage, streamMessage, getMetrics };